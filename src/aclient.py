@@ -1,8 +1,11 @@
 import os
+import time
 import asyncio
-import json
+import signal
+import functools
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any, Tuple
+from typing import Dict, List, Optional, Any, Tuple, Callable, Awaitable, Hashable, NamedTuple, AsyncContextManager
 from dotenv import load_dotenv
 
 # discord
@@ -59,24 +62,60 @@ from g4f.models import __models__
 # local
 from src.locale_manager import locale_manager as lm
 from src.log import logger
-from utils.message_utils import send_split_message
-from utils.files_utils import write_json, read_file, write_file
+from utils.message_utils import send_split_message, StreamingMessage, extract_thinking
+from utils.history_utils import history_window, with_summary, split_reasoning, strip_reasoning, HistoryCompactor
+from utils.http_utils import HttpClientManager
+from utils.persistence_utils import WriteBehindStore
+from utils.lock_utils import KeyedLocks
+from utils.storage_utils import create_storage
+from utils.scheduler_utils import RequestScheduler, SchedulerFullError, SEARCH_COST
+from utils.deadline_utils import Deadline, DeadlineExceeded, deadline_stats, REQUEST_DEADLINE
+from utils.files_utils import read_file, append_file, json_dumps
 from utils.encryption_utils import UserDataEncryptor
 from utils.reminder_utils import init_reminder_scheduler, run_reminder_scheduler
 from utils.ban_utils import ban_manager
+from utils.provider_utils import (
+    provider_scoreboard,
+    hedge_limiter,
+    provider_breakers,
+    provider_bulkheads,
+    request_coalescer,
+    request_key,
+    get_provider_name,
+    ProviderBusyError,
+    CircuitOpenError,
+    ProviderHealthProber,
+    PROBE_MESSAGES,
+    load_provider_snapshot,
+    save_provider_snapshot,
+    parse_fallback_chains,
+    rank_fallback_models,
+    DEFAULT_MODEL_FALLBACKS
+)
 from utils.internet_utils import search_web, prepare_search_results
-from utils.internet_instructions_utils import get_web_search_instruction, get_image_search_instruction, get_video_search_instruction
+from utils.internet_instructions_utils import get_web_search_instruction, get_image_search_instruction, get_video_search_instruction, strip_search_context
 
 # Constants
 SYSTEM_DATA_FILE = 'system.json'
 USER_DATA_DIR = 'user_data'
+REASONING_DIR = os.path.join(USER_DATA_DIR, 'reasoning')
 REMINDERS_DIR = 'reminders'
 BANS_DIR = 'bans'
 SYSTEM_INSTRUCTION_FILE = "system_prompt.txt"
+PROVIDER_STATS_FILE = "provider_stats.json"
+PROVIDER_STATS_SAVE_INTERVAL = 300  # seconds between provider snapshot saves
+QUEUE_WAIT_LOG_THRESHOLD = 0.5  # log provider queue waits longer than this (seconds)
+PROBE_TICK = 30                 # seconds between checks for due provider probes
+SCHEDULER_METRICS_INTERVAL = 300  # seconds between scheduler metrics log lines
+STORAGE_MAINTENANCE_INTERVAL = 300  # seconds between storage compaction and metrics runs
+WRITE_BEHIND_FLUSH_TIMEOUT = 30  # seconds close() waits for pending conversation writes
+CACHE_SWEEP_INTERVAL = 300  # seconds between removals of expired cache entries
+CACHE_MAX_BYTES = 64 * 1024 * 1024  # default memory budget of the user cache
+CACHE_ENTRY_OVERHEAD = 512      # estimated bytes of a cached entry besides its messages
+CACHE_MESSAGE_OVERHEAD = 160    # estimated bytes of a cached message besides its text
 
 # Initialize environment
 load_dotenv()
-client = AsyncClient()
 g4f.debug.logging = os.getenv("G4F_DEBUG", "True")
 
 # Setup directories
@@ -195,68 +234,155 @@ def _initialize_providers_and_keys() -> Tuple[Dict[str, List[Any]], Dict[Any, Op
         except Exception as e:
             logger.error(lm.get('log_provider_add_error').format(provider=provider_name, error=e))
 
+    # Warm-start provider ordering from the last persisted snapshot
+    loaded = load_provider_snapshot(PROVIDER_STATS_FILE)
+    if loaded:
+        for model_name, providers in providers_dict.items():
+            providers_dict[model_name] = provider_scoreboard.order(model_name, providers)
+        logger.info(lm.get('log_provider_snapshot_loaded').format(count=loaded, filepath=PROVIDER_STATS_FILE))
+
     logger.info(lm.get('log_providers_complete'))
     return providers_dict, provider_api_keys
 
+class ConversationKey(NamedTuple):
+    """Identity of a stored conversation: a user's DMs, a guild channel or the system channel."""
+    kind: str  # 'user', 'channel' or 'system'
+    id: Optional[int]
+
 class UserCache:
-    """Cache for user data with sliding and absolute TTL."""
+    """LRU cache for user data with sliding and absolute TTL and a memory budget."""
     
-    def __init__(self, sliding_ttl: timedelta = timedelta(hours=1), absolute_ttl: timedelta = timedelta(hours=24)):
+    def __init__(
+        self,
+        sliding_ttl: timedelta = timedelta(hours=1),
+        absolute_ttl: timedelta = timedelta(hours=24),
+        max_bytes: int = CACHE_MAX_BYTES
+    ):
         """
         Initialize the user cache.
         
         Args:
             sliding_ttl: Time of inactivity after which cache is removed
             absolute_ttl: Maximum time data can be stored from load time
+            max_bytes: Approximate memory the cached data may take
         """
-        self.cache: Dict[int, Tuple[Any, datetime, datetime]] = {}
+        # key -> (data, load time, last access, size), least recently used first
+        self.cache: OrderedDict[Hashable, Tuple[Any, datetime, datetime, int]] = OrderedDict()
         self.sliding_ttl = sliding_ttl
         self.absolute_ttl = absolute_ttl
+        self.max_bytes = max_bytes
+        self.size = 0
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def estimate_size(data: Any) -> int:
+        """
+        Rough memory footprint of user data in bytes, dominated by message texts.
 
-    def get(self, user_id: int) -> Optional[Any]:
+        Every list is counted, so history, compaction_queue and any other message
+        lists kept in user data share the same budget.
         """
-        Get cached data for a user.
+        if not isinstance(data, dict):
+            return CACHE_ENTRY_OVERHEAD
+        size = CACHE_ENTRY_OVERHEAD
+        for value in data.values():
+            if isinstance(value, list):
+                for item in value:
+                    content = item.get('content', '') if isinstance(item, dict) and 'content' in item else item
+                    size += CACHE_MESSAGE_OVERHEAD + len(str(content))
+            elif isinstance(value, str):
+                size += len(value)
+        return size
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, _, size = self.cache.pop(key)
+        self.size -= size
+
+    def _expired(self, entry: Tuple[Any, datetime, datetime, int], now: datetime) -> bool:
+        _, load_time, last_access, _ = entry
+        return now - load_time > self.absolute_ttl or now - last_access > self.sliding_ttl
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Get cached data for a conversation.
         
         Args:
-            user_id: Discord user ID
+            key: Conversation key
             
         Returns:
             Cached data or None if not found/expired
         """
-        if user_id in self.cache:
-            data, load_time, last_access = self.cache[user_id]
-            now = datetime.now()
+        entry = self.cache.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
 
-            if now - load_time > self.absolute_ttl:
-                del self.cache[user_id]
-                return None
-
-            if now - last_access > self.sliding_ttl:
-                del self.cache[user_id]
-                return None
-                
-            self.cache[user_id] = (data, load_time, now)
-            return data
-        return None
+        now = datetime.now()
+        if self._expired(entry, now):
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        data, load_time, _, size = entry
+        self.cache[key] = (data, load_time, now, size)
+        self.cache.move_to_end(key)
+        self.hits += 1
+        return data
 
-    def set(self, user_id: int, data: Any) -> None:
+    def set(self, key: Hashable, data: Any) -> None:
         """
-        Set data in cache for a user.
+        Set data in cache for a conversation, evicting the least recently used entries over the budget.
         
         Args:
-            user_id: Discord user ID
+            key: Conversation key
             data: Data to cache
         """
+        if key in self.cache:
+            self._remove(key)
         now = datetime.now()
-        self.cache[user_id] = (data, now, now)
+        size = self.estimate_size(data)
+        self.cache[key] = (data, now, now, size)
+        self.size += size
+
+        # Always keep the newest entry, even if it alone is over the budget
+        while self.size > self.max_bytes and len(self.cache) > 1:
+            self._remove(next(iter(self.cache)))
+            self.evictions += 1
 
     def clear_expired(self) -> None:
         """Clear all expired entries from cache."""
         now = datetime.now()
-        for user_id in list(self.cache.keys()):
-            data, load_time, last_access = self.cache[user_id]
-            if now - load_time > self.absolute_ttl or now - last_access > self.sliding_ttl:
-                del self.cache[user_id]
+        for key in [key for key, entry in self.cache.items() if self._expired(entry, now)]:
+            self._remove(key)
+            self.expirations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Entry count, memory use and hit, miss and eviction counters."""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.cache),
+            'size': self.size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+
+def _parse_channel_id(value: Optional[str]) -> Optional[int]:
+    """Parse a channel ID from the environment, None if it is unset or invalid."""
+    try:
+        return int(value) if value else None
+    except ValueError:
+        logger.error(lm.get('log_channel_id_invalid').format(value=value))
+        return None
 
 class DiscordClient(discord.Client):
     """Discord client with AI chat capabilities."""
@@ -271,26 +397,64 @@ class DiscordClient(discord.Client):
         self.tree = app_commands.CommandTree(self)
         self.providers_dict, self.provider_api_keys = _initialize_providers_and_keys()
         self.default_model = os.getenv("MODEL", "gpt-4o")
+        self.system_channel_id = _parse_channel_id(os.getenv("DISCORD_CHANNEL_ID"))
         self.max_history_length = int(os.getenv("MAX_HISTORY_LENGTH", 30))
         self.apply_instruction_to_all = os.getenv("APPLY_INSTRUCTION_TO_ALL", "False").lower() == "true"
         self.cache_enabled = os.getenv("CACHE_ENABLED", "True").lower() == "true"
+        self.write_behind_enabled = os.getenv("WRITE_BEHIND_ENABLED", "True").lower() == "true"
+        self.storage = create_storage(os.getenv("STORAGE_BACKEND", "json"), self._should_encrypt)
         self.encrypt_user_data = os.getenv('ENCRYPT_USER_DATA', 'False').lower() == 'true'
         self.encrypt_channels = os.getenv('ENCRYPT_CHANNELS', 'False').lower() == 'true'
+        self.stream_responses = os.getenv("STREAM_RESPONSES", "True").lower() == "true"
+        self.hedge_enabled = os.getenv("HEDGE_ENABLED", "True").lower() == "true"
+        self.hedge_percentile = float(os.getenv("HEDGE_PERCENTILE", 95)) / 100
+        self.hedge_max_in_flight = int(os.getenv("HEDGE_MAX_IN_FLIGHT", 1))
+        self.provider_max_queue_wait = float(os.getenv("PROVIDER_MAX_QUEUE_WAIT", 10))
+        self.request_deadline = float(os.getenv("REQUEST_DEADLINE", REQUEST_DEADLINE))
         
         # Initialize tasks
         self.reminder_task = None
         self.ban_cleanup_task = None
+        self.provider_probe_task = None
+        self.provider_stats_task = None
+        self.history_compaction_task = None
         
         # Initialize providers
         default_providers = self.providers_dict.get(self.default_model, [])
         self.default_provider = RetryProvider(default_providers, shuffle=False)
-        self.clients_by_provider = {}
-        self.chatBot = AsyncClient(provider=self.default_provider)
+        self.http_clients = HttpClientManager()
+        self.health_probe_enabled = os.getenv("HEALTH_PROBE_ENABLED", "True").lower() == "true"
+        self.health_prober = ProviderHealthProber(
+            self._probe_provider,
+            interval=float(os.getenv("HEALTH_PROBE_INTERVAL", 600))
+        )
+        self.history_compaction_enabled = os.getenv("HISTORY_COMPACTION_ENABLED", "True").lower() == "true"
+        self.summary_model = os.getenv("SUMMARY_MODEL", "gpt-4o-mini")
+        self.search_cleanup_enabled = os.getenv("SEARCH_HISTORY_CLEANUP", "True").lower() == "true"
+        self.archive_reasoning = os.getenv("ARCHIVE_REASONING", "False").lower() == "true"
+        self.model_fallback_enabled = os.getenv("MODEL_FALLBACK_ENABLED", "True").lower() == "true"
+        self.model_fallbacks = {**DEFAULT_MODEL_FALLBACKS, **parse_fallback_chains(os.getenv("MODEL_FALLBACK_CHAINS", ""))}
+        self.request_scheduler = RequestScheduler(admin_id=ban_manager.admin_id)
+        self.scheduler_metrics_task = None
+        self.storage_maintenance_task = None
+        self.cache_sweep_task = None
+        self.user_data_writer = WriteBehindStore(self._write_pending_user_data)
+        self.conversation_locks = KeyedLocks()
+        self.history_compactor = HistoryCompactor(
+            self._summarize_history,
+            self.load_user_data,
+            self.save_user_data,
+            self.lock_conversation
+        )
         
         # Initialize state
         self.current_channel = None
         self.activity = discord.Activity(type=discord.ActivityType.listening, name="/ask /draw /help")
-        self.user_cache = UserCache(sliding_ttl=timedelta(hours=1), absolute_ttl=timedelta(hours=24))
+        self.user_cache = UserCache(
+            sliding_ttl=timedelta(hours=1),
+            absolute_ttl=timedelta(hours=24),
+            max_bytes=int(os.getenv("CACHE_MAX_MB", CACHE_MAX_BYTES // (1024 * 1024))) * 1024 * 1024
+        )
 
     async def setup_hook(self) -> None:
         """Set up the client's background tasks."""
@@ -313,6 +477,57 @@ class DiscordClient(discord.Client):
                     logger.error(lm.get('log_request_error').format(error=e))
                 await asyncio.sleep(1800)
 
+        async def run_provider_probes():
+            while True:
+                try:
+                    await self.health_prober.run_once(self.providers_dict)
+                except Exception as e:
+                    logger.error(lm.get('log_probe_error').format(error=e))
+                await asyncio.sleep(PROBE_TICK)
+
+        async def run_history_compaction():
+            while True:
+                try:
+                    await self.history_compactor.run_once()
+                except Exception as e:
+                    logger.error(lm.get('log_compaction_error').format(error=e))
+
+        async def run_scheduler_metrics():
+            while True:
+                await asyncio.sleep(SCHEDULER_METRICS_INTERVAL)
+                try:
+                    self.request_scheduler.log_metrics()
+                except Exception as e:
+                    logger.error(lm.get('log_request_error').format(error=e))
+
+        async def run_storage_maintenance():
+            while True:
+                await asyncio.sleep(STORAGE_MAINTENANCE_INTERVAL)
+                try:
+                    await self.storage.maintain()
+                    stats = self.storage.stats()
+                    if stats:
+                        logger.info(lm.get('log_storage_stats').format(**stats))
+                except Exception as e:
+                    logger.error(lm.get('log_request_error').format(error=e))
+
+        async def run_cache_sweep():
+            while True:
+                await asyncio.sleep(CACHE_SWEEP_INTERVAL)
+                try:
+                    self.user_cache.clear_expired()
+                    logger.info(lm.get('log_cache_stats').format(**self.user_cache.stats()))
+                except Exception as e:
+                    logger.error(lm.get('log_request_error').format(error=e))
+
+        async def run_provider_stats_save():
+            while True:
+                await asyncio.sleep(PROVIDER_STATS_SAVE_INTERVAL)
+                try:
+                    await save_provider_snapshot(PROVIDER_STATS_FILE)
+                except Exception as e:
+                    logger.error(lm.get('log_provider_snapshot_save_error').format(error=e))
+
         if not hasattr(self, 'reminder_task') or self.reminder_task is None:
             logger.info(lm.get('log_reminder_task_init'))
             self.reminder_task = asyncio.create_task(run_reminders_check())
@@ -321,9 +536,52 @@ class DiscordClient(discord.Client):
             logger.info(lm.get('log_ban_task_init'))
             self.ban_cleanup_task = asyncio.create_task(run_bans_check())
 
+        if self.health_probe_enabled and self.provider_probe_task is None:
+            logger.info(lm.get('log_probe_task_init'))
+            self.provider_probe_task = asyncio.create_task(run_provider_probes())
+
+        if self.provider_stats_task is None:
+            self.provider_stats_task = asyncio.create_task(run_provider_stats_save())
+
+        if self.history_compaction_enabled and self.history_compaction_task is None:
+            self.history_compaction_task = asyncio.create_task(run_history_compaction())
+
+        if self.scheduler_metrics_task is None:
+            self.scheduler_metrics_task = asyncio.create_task(run_scheduler_metrics())
+
+        if self.storage_maintenance_task is None:
+            self.storage_maintenance_task = asyncio.create_task(run_storage_maintenance())
+
+        if self.cache_enabled and self.cache_sweep_task is None:
+            self.cache_sweep_task = asyncio.create_task(run_cache_sweep())
+
+        # Flush pending conversations when the host stops the bot
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(self.close()))
+        except (NotImplementedError, RuntimeError):
+            pass
+
         logger.info(lm.get('log_tasks_init_complete'))
 
-    async def process_request(self, query: str, user_id: int, request_type: str = "search") -> List[str]:
+    async def close(self) -> None:
+        """Persist runtime state and close the client."""
+        try:
+            await save_provider_snapshot(PROVIDER_STATS_FILE)
+            logger.info(lm.get('log_provider_snapshot_saved').format(filepath=PROVIDER_STATS_FILE))
+        except Exception as e:
+            logger.error(lm.get('log_provider_snapshot_save_error').format(error=e))
+        await self.user_data_writer.flush_all(timeout=WRITE_BEHIND_FLUSH_TIMEOUT)
+        await self.storage.close()
+        await self.http_clients.close()
+        await super().close()
+
+    async def process_request(
+        self,
+        query: str,
+        user_id: int,
+        request_type: str = "search",
+        deadline: Optional[Deadline] = None
+    ) -> List[str]:
         """
         Process a user's request and return appropriate responses.
         
@@ -331,19 +589,22 @@ class DiscordClient(discord.Client):
             query: User's query
             user_id: Discord user ID
             request_type: Type of request (search, images, videos)
+            deadline: Optional request deadline bounding search and page fetches
             
         Returns:
             List of response messages
         """
         self.user_id = user_id
         try:
-            results = await search_web(query, request_type)
+            results = await search_web(query, request_type, deadline=deadline)
             if not results:
                 return [lm.get('error_no_results').format(query=query)]
 
             if request_type == 'search':
                 try:
-                    processed_results = await prepare_search_results(results)
+                    processed_results = await prepare_search_results(
+                        results, session=self.http_clients.session(), deadline=deadline
+                    )
                     return [
                         get_web_search_instruction(result) 
                         for result in processed_results
@@ -375,7 +636,13 @@ class DiscordClient(discord.Client):
                 lm.get('error_try_later_or_change_query')
             ]
 
-    async def send_message(self, message: Any, user_message: str, request_type: str) -> None:
+    async def send_message(
+        self,
+        message: Any,
+        user_message: str,
+        request_type: str,
+        deadline: Optional[Deadline] = None
+    ) -> None:
         """
         Send a message to the user.
         
@@ -383,7 +650,9 @@ class DiscordClient(discord.Client):
             message: Discord message object
             user_message: User's message
             request_type: Type of request
+            deadline: Request deadline, started when the request arrived if omitted
         """
+        deadline = deadline or Deadline.after(self.request_deadline)
         try:
             if hasattr(message, 'user'):
                 user_id = message.user.id
@@ -394,18 +663,31 @@ class DiscordClient(discord.Client):
             else:
                 raise ValueError(lm.get('error_unsupported_message_type'))
                 
-            response = await self.handle_response(user_id, user_message, request_type)
+            stream = StreamingMessage(message) if self.stream_responses else None
+            response = await self.handle_response(
+                user_id, user_message, request_type,
+                on_delta=stream.update if stream else None,
+                deadline=deadline
+            )
+            if stream is not None and stream.started:
+                deadline.check('send')
+                await stream.finish(response)
+                return
+
             if not response:
                 error_message = (
                     f"> :x: **{lm.get('error_request_processing')}** \n"
                     f"> {lm.get('error_try_again_or_contact_admin')}"
                 )
                 logger.error(lm.get('log_user_ask_error').format(username=username, error=lm.get('error_empty_ai_response')))
-                await send_split_message(self, error_message, message)
+                await send_split_message(self, error_message, message, deadline=deadline)
                 return
                 
             response_content = f'\n{response}'
-            await send_split_message(self, response_content, message)
+            await send_split_message(self, response_content, message, deadline=deadline)
+        except DeadlineExceeded:
+            # The interaction token is gone or about to be, nobody is left to answer
+            return
         except Exception as e:
             error_message = (
                 f"> :x: **{lm.get('error_request_processing')}** \n"
@@ -414,25 +696,82 @@ class DiscordClient(discord.Client):
             )
             logger.exception(lm.get('log_send_error').format(error=e))
             try:
-                await send_split_message(self, error_message, message)
+                await send_split_message(self, error_message, message, deadline=deadline)
+            except DeadlineExceeded:
+                pass
             except Exception as send_error:
                 logger.error(lm.get('log_send_critical_error').format(error=send_error))
 
+    async def schedule_message(
+        self,
+        message: Any,
+        user_message: str,
+        request_type: Optional[str],
+        deadline: Optional[Deadline] = None
+    ) -> None:
+        """
+        Queue send_message in the fair scheduler, telling the user their position if they have to wait.
+        
+        Args:
+            message: Discord message or interaction object
+            user_message: User's message
+            request_type: Type of request
+            deadline: Request deadline
+        """
+        user = message.user if hasattr(message, 'user') else message.author
+        channel_id = message.channel.id if message.guild is not None else None
+        if hasattr(message, 'followup'):
+            notify = lambda content: message.followup.send(content, wait=True)
+        else:
+            notify = message.channel.send
+        state = {'started': False, 'notice': None}
+
+        async def delete_notice() -> None:
+            notice, state['notice'] = state['notice'], None
+            if notice is not None:
+                try:
+                    await notice.delete()
+                except discord.HTTPException:
+                    pass
+
+        async def run() -> None:
+            state['started'] = True
+            await delete_notice()
+            if deadline is not None and deadline.expired:
+                deadline_stats.record('queue')
+                return
+            await self.send_message(message, user_message, request_type, deadline=deadline)
+
+        try:
+            position = self.request_scheduler.submit(
+                user.id, channel_id, run,
+                cost=SEARCH_COST if request_type else 1.0
+            )
+        except SchedulerFullError as e:
+            logger.warning(lm.get('log_scheduler_rejected').format(username=str(user), error=e))
+            await notify(f"> :hourglass: {e}")
+            return
+
+        if position:
+            state['notice'] = await notify(lm.get('scheduler_queue_position').format(position=position))
+            if state['started']:
+                await delete_notice()
+
     async def send_start_prompt(self) -> None:
         """Send the initial system prompt to the configured channel."""
         try:
-            discord_channel_id = os.getenv("DISCORD_CHANNEL_ID")
-            if not discord_channel_id:
+            discord_channel_id = self.system_channel_id
+            if discord_channel_id is None:
                 logger.error(lm.get('log_channel_error'))
                 return
                 
             await self.wait_until_ready()
-            channel = self.get_channel(int(discord_channel_id))
+            channel = self.get_channel(discord_channel_id)
             if channel is None:
                 logger.error(lm.get('log_channel_error').format(channel_id=discord_channel_id))
                 return
                 
-            user_data = await self.load_user_data(None, int(discord_channel_id))
+            user_data = await self.load_user_data(None, discord_channel_id)
             starting_prompt = user_data.get('instruction', '')
             logger.info(lm.get('log_system_instructions').format(size=len(starting_prompt)))
             
@@ -440,7 +779,11 @@ class DiscordClient(discord.Client):
                 logger.error(lm.get('log_system_instructions_empty'))
                 return
                 
-            response = await self.handle_response(None, starting_prompt, channel_id=int(discord_channel_id))
+            response = await self.handle_response(
+                None, starting_prompt,
+                channel_id=discord_channel_id,
+                deadline=Deadline.after(self.request_deadline)
+            )
             if response:
                 await channel.send(f"{response}")
                 logger.info(lm.get('log_start_prompt_success'))
@@ -451,7 +794,15 @@ class DiscordClient(discord.Client):
         except Exception as e:
             logger.error(lm.get('log_start_prompt_critical').format(error=str(e)))
 
-    async def handle_response(self, user_id: int, user_message: str, request_type: str = None, channel_id: Optional[int] = None) -> str:
+    async def handle_response(
+        self,
+        user_id: int,
+        user_message: str,
+        request_type: str = None,
+        channel_id: Optional[int] = None,
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+        deadline: Optional[Deadline] = None
+    ) -> str:
         """
         Handle user message and generate response.
         
@@ -460,10 +811,25 @@ class DiscordClient(discord.Client):
             user_message: User's message
             request_type: Type of request
             channel_id: Discord channel ID
+            on_delta: Stream the response and call this with the formatted text received so far
+            deadline: Optional request deadline shared by search and provider calls
             
         Returns:
             Generated response
         """
+        # Turns of one conversation run one at a time, so none overwrites another's history
+        async with self.lock_conversation(user_id, channel_id):
+            return await self._handle_response(user_id, user_message, request_type, channel_id, on_delta, deadline)
+
+    async def _handle_response(
+        self,
+        user_id: int,
+        user_message: str,
+        request_type: str,
+        channel_id: Optional[int],
+        on_delta: Optional[Callable[[str], Awaitable[None]]],
+        deadline: Optional[Deadline]
+    ) -> str:
         try:
             user_data = await self.load_user_data(user_id, channel_id)
             history = user_data.get('history', [])
@@ -471,14 +837,35 @@ class DiscordClient(discord.Client):
             user_instruction = user_data.get('instruction', '')
             
             # Update history with user message
-            history = self._update_conversation_history(history, user_message)
+            history, dropped = self._update_conversation_history(history, user_message, model)
             
-            # Append search results if request_type is provided
+            # Search results are context for this completion only
+            search_context = []
             if request_type:
-                history = await self._append_search_results(history, user_message, request_type, user_id)
+                search_context = await self._get_search_context(user_message, request_type, user_id, deadline=deadline)
             
+            # Format response with info about the model that actually answered
+            def format_model_response(answered_model: str) -> str:
+                model_response = lm.get('model_response').format(
+                    model=answered_model,
+                    bot_name=os.environ.get('BOT_NAME'),
+                    version=os.environ.get('VERSION_BOT')
+                )
+                if answered_model != model:
+                    model_response += '\n' + lm.get('model_fallback_notice').format(model=model, fallback=answered_model)
+                return model_response
+
+            async def _on_delta(answered_model: str, text: str) -> None:
+                await on_delta(f"{format_model_response(answered_model)}\n\n{text}")
+
+            on_model_delta = _on_delta if on_delta is not None else None
+
             # Get response from provider
-            response_data = await self._get_response_from_provider(model, history)
+            answered_model, response_data = await self._get_response_with_fallback(
+                model, history, on_delta=on_model_delta, deadline=deadline,
+                summary=user_data.get('summary', ''), search_context=search_context
+            )
+            model_response = format_model_response(answered_model)
             
             if 'error' in response_data:
                 logger.error(f"handle_response: {response_data['error']}")
@@ -486,20 +873,22 @@ class DiscordClient(discord.Client):
                 
             response_content = response_data['bot_response']
             
-            # Update history with response
-            history.append({'role': 'assistant', 'content': response_content})
+            # Update history with the final answer only, reasoning is not sent back to the model
+            reasoning, answer = split_reasoning(response_content)
+            history.append({'role': 'assistant', 'content': answer})
+            if reasoning and self.archive_reasoning:
+                await self._archive_reasoning(user_id, channel_id, answered_model, reasoning)
             
             # Save updated history
             user_data['history'] = history
             user_data['instruction'] = user_instruction
+            if dropped and self.history_compaction_enabled:
+                # Only a completed turn ages messages out, so a failed one cannot queue them twice
+                self.history_compactor.enqueue(user_data, dropped)
             await self.save_user_data(user_id, user_data, channel_id)
+            if self.history_compaction_enabled and user_data.get('compaction_queue'):
+                self.history_compactor.schedule(user_id, channel_id)
             
-            # Format response with model info
-            model_response = lm.get('model_response').format(
-                model=model,
-                bot_name=os.environ.get('BOT_NAME'),
-                version=os.environ.get('VERSION_BOT')
-            )
             return f"{model_response}\n\n{response_content}"
             
         except Exception as e:
@@ -509,99 +898,414 @@ class DiscordClient(discord.Client):
                 f"**{lm.get('error_details')}:** ```{str(e)}```"
             )
 
-    def _update_conversation_history(self, history: List[Dict[str, str]], user_message: str) -> List[Dict[str, str]]:
+    def _update_conversation_history(
+        self,
+        history: List[Dict[str, str]],
+        user_message: str,
+        model: Optional[str] = None
+    ) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
         """
         Update conversation history with new message.
+
+        Old messages are dropped once the history exceeds the model's token
+        budget; MAX_HISTORY_LENGTH still caps the number of messages. With
+        compaction enabled, old turns leave earlier and in batches so they
+        can be folded into the rolling summary.
         
         Args:
-            history: Current conversation history
+            history: Current conversation history, left unchanged
             user_message: New user message
+            model: Model the history will be sent to
             
         Returns:
-            Updated conversation history
+            Tuple of (updated conversation history, dropped messages)
         """
-        history.append({'role': 'user', 'content': user_message})
-        if len(history) > self.max_history_length:
-            system_message = next((msg for msg in history if msg['role'] == 'system'), None)
-            if system_message:
-                history = [system_message] + history[-(self.max_history_length - 1):]
-            else:
-                history = history[-self.max_history_length:]
-        return history
+        history = history + [{'role': 'user', 'content': user_message}]
+        window = history_window.compact if self.history_compaction_enabled else history_window.trim
+        return window(history, model or self.default_model, self.max_history_length)
 
-    async def _append_search_results(self, history: List[Dict[str, str]], user_message: str, request_type: str, user_id: int) -> List[Dict[str, str]]:
+    async def _get_search_context(
+        self,
+        user_message: str,
+        request_type: str,
+        user_id: int,
+        deadline: Optional[Deadline] = None
+    ) -> List[Dict[str, str]]:
         """
-        Append search results to conversation history.
+        Get search results as context for a single completion; they are not saved to history.
         
         Args:
-            history: Current conversation history
             user_message: User's message
             request_type: Type of request
             user_id: Discord user ID
+            deadline: Optional request deadline
             
         Returns:
-            Updated conversation history
+            Messages to send after the conversation history
         """
         try:
-            search_results = await self.process_request(user_message, user_id, request_type=request_type)
-            for result in search_results:
-                history.append({'role': 'assistant', 'content': result})
+            search_results = await self.process_request(user_message, user_id, request_type=request_type, deadline=deadline)
+            return [{'role': 'assistant', 'content': result} for result in search_results]
         except Exception as e:
             logger.error(lm.get('log_search_error').format(error=e))
-            history.append({'role': 'system', 'content': f"{lm.get('error_search_failed')}: {str(e)}"})
-        return history
+            return [{'role': 'system', 'content': f"{lm.get('error_search_failed')}: {str(e)}"}]
+
+    def _get_provider_client(self, provider: Any) -> AsyncClient:
+        """
+        Get or create a client for a provider, with api_key if available.
+
+        Args:
+            provider: Provider class
+
+        Returns:
+            AsyncClient bound to the provider
+        """
+        return self.http_clients.ai_client(provider, self.provider_api_keys.get(provider))
+
+    async def _request_provider(
+        self,
+        user_model: str,
+        provider: Any,
+        conversation_history: List[Dict[str, str]],
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+        claim: Optional[Callable[[], bool]] = None,
+        probe: bool = False
+    ) -> str:
+        """
+        Send a single completion request to one provider and record its outcome.
+
+        Args:
+            user_model: The name of the model to use.
+            provider: Provider class to query.
+            conversation_history: The list of past messages (role/content dicts).
+            on_delta: Stream the completion and call this with the text received so far.
+            claim: Called on the first streamed token; returns False if another provider already answered.
+            probe: Health probe, its latency is not recorded for ranking and hedging.
+
+        Returns:
+            The text reply from the AI.
+
+        Raises:
+            CircuitOpenError: If the provider's circuit breaker does not let the request through
+        """
+        # The breaker slot is taken here, once the task runs, so a task cancelled
+        # before its first step never holds a half-open probe slot
+        if not provider_breakers.allow_request(provider):
+            raise CircuitOpenError(lm.get('error_provider_circuit_open').format(provider=get_provider_name(provider)))
+
+        logger.info(lm.get('log_provider_trying').format(provider=provider))
+        client = self._get_provider_client(provider)
+        bulkhead = provider_bulkheads.get(provider)
+        service_time = provider_scoreboard.get(user_model, provider).expected_latency()
+        first_token = None
+
+        try:
+            async with bulkhead.slot(self.provider_max_queue_wait, service_time) as queue_wait:
+                if queue_wait >= QUEUE_WAIT_LOG_THRESHOLD:
+                    logger.info(lm.get('log_provider_queue_wait').format(
+                        provider=bulkhead.name,
+                        wait=queue_wait,
+                        active=bulkhead.active,
+                        waiting=bulkhead.waiting
+                    ))
+
+                # Provider latency is measured from the moment a slot is acquired
+                start = time.monotonic()
+                if on_delta is None:
+                    response = await client.chat.completions.create(
+                        model=user_model,
+                        messages=conversation_history,
+                        provider=provider
+                    )
+                    content = response.choices[0].message.content
+                else:
+                    content = ""
+                    stream = client.chat.completions.create(
+                        model=user_model,
+                        messages=conversation_history,
+                        provider=provider,
+                        stream=True
+                    )
+                    async for chunk in stream:
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if not delta:
+                            continue
+                        if first_token is None:
+                            first_token = time.monotonic() - start
+                            logger.info(lm.get('log_provider_first_token').format(
+                                provider=get_provider_name(provider),
+                                model=user_model,
+                                latency=first_token
+                            ))
+                            if claim is not None and not claim():
+                                raise asyncio.CancelledError()
+                        content += str(delta)
+                        await on_delta(content)
+                    if not content:
+                        raise ValueError(lm.get('error_empty_ai_response'))
+                latency = time.monotonic() - start
+        except ProviderBusyError:
+            # Not the provider's fault: fail over without touching its stats
+            provider_breakers.release(provider)
+            logger.warning(lm.get('log_provider_busy').format(provider=bulkhead.name, wait=self.provider_max_queue_wait))
+            raise
+        except asyncio.CancelledError:
+            provider_breakers.release(provider)
+            raise
+        except Exception as e:
+            logger.exception(lm.get('log_provider_failed').format(provider=provider, error=e))
+            provider_breakers.record_failure(provider, e)
+            stats = provider_scoreboard.record_failure(user_model, provider, e)
+            logger.info(lm.get('log_provider_stats').format(provider=get_provider_name(provider), model=user_model, **stats.to_dict()))
+            raise
+
+        provider_breakers.record_success(provider)
+        provider_scoreboard.record_success(user_model, provider, latency, first_token, probe=probe)
+        logger.info(lm.get('log_provider_success').format(provider=get_provider_name(provider), model=user_model, latency=latency))
+        return content
+
+    async def _probe_provider(self, user_model: str, provider: Any) -> str:
+        """
+        Send a tiny health-check request to a provider; the outcome feeds its success ratio and breaker.
+
+        Args:
+            user_model: The name of the model to probe.
+            provider: Provider class to probe.
+
+        Returns:
+            The text reply from the AI.
+        """
+        return await self._request_provider(user_model, provider, PROBE_MESSAGES, probe=True)
+
+    async def _summarize_history(self, messages: List[Dict[str, str]]) -> str:
+        """
+        Ask the summary model to update a conversation summary.
+
+        Args:
+            messages: Summary prompt built by build_summary_prompt
+
+        Returns:
+            The new summary text
+
+        Raises:
+            RuntimeError: If every provider of the summary model failed
+        """
+        response_data = await self._get_response_from_provider(self.summary_model, messages)
+        if 'error' in response_data:
+            raise RuntimeError(response_data['error'])
+        _, summary = extract_thinking(response_data['bot_response'])
+        return summary
+
+    async def _get_response_with_fallback(
+        self,
+        user_model: str,
+        conversation_history: List[Dict[str, str]],
+        on_delta: Optional[Callable[[str, str], Awaitable[None]]] = None,
+        deadline: Optional[Deadline] = None,
+        summary: str = '',
+        search_context: Optional[List[Dict[str, str]]] = None
+    ) -> Tuple[str, Dict[str, str]]:
+        """
+        Get a response from the user's model, falling back to other models of
+        its chain, best health first, if every provider of it failed.
+
+        The prompt is built per model from the stored history, so a fallback
+        with a smaller budget windows the history itself and still gets the
+        summary, the user's question and the search results.
+
+        Args:
+            user_model: The name of the model chosen by the user.
+            conversation_history: The stored conversation history, ending with the user's message.
+            on_delta: Stream the completion and call this with the answering model and the text received so far.
+            deadline: Optional request deadline.
+            summary: Rolling summary of older turns.
+            search_context: Search result messages for this completion only.
+
+        Returns:
+            Tuple of (model that answered, same dict as _get_response_from_provider);
+            on failure the model is the user's one and the error is its own.
+        """
+        search_context = search_context or []
+        response_data = await self._get_coalesced_response(
+            user_model, with_summary(conversation_history, summary) + search_context,
+            on_delta=functools.partial(on_delta, user_model) if on_delta else None,
+            deadline=deadline
+        )
+        if 'error' not in response_data or not self.model_fallback_enabled:
+            return user_model, response_data
+
+        fallbacks = rank_fallback_models(self.model_fallbacks.get(user_model, []), self.providers_dict)
+        for fallback_model in fallbacks:
+            if deadline is not None and deadline.expired:
+                break
+            logger.warning(lm.get('log_model_fallback').format(model=user_model, fallback=fallback_model))
+            # The fallback may have a smaller context budget than the user's model;
+            # window the stored history only, leaving room for the summary and search results
+            extra = history_window.count(with_summary([], summary) + search_context)
+            budget = max(history_window.budget_for(fallback_model) - extra, 1)
+            fallback_history, _ = history_window.trim(conversation_history, fallback_model, budget=budget)
+            fallback_data = await self._get_coalesced_response(
+                fallback_model, with_summary(fallback_history, summary) + search_context,
+                on_delta=functools.partial(on_delta, fallback_model) if on_delta else None,
+                deadline=deadline
+            )
+            if 'error' not in fallback_data:
+                return fallback_model, fallback_data
+        return user_model, response_data
+
+    async def _get_coalesced_response(
+        self,
+        user_model: str,
+        conversation_history: List[Dict[str, str]],
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+        deadline: Optional[Deadline] = None
+    ) -> Dict[str, str]:
+        """
+        Get a response, sharing one provider call between identical in-flight requests.
+
+        Streamed deltas go to every caller that is still waiting; a caller that
+        hit its own deadline or was cancelled stops receiving them. The shared
+        call, with every provider attempt in it, is cancelled once no caller is
+        waiting anymore.
+
+        Args:
+            user_model: The name of the model to use.
+            conversation_history: The list of past messages (role/content dicts).
+            on_delta: Stream the completion and call this with the text received so far.
+            deadline: Optional request deadline.
+
+        Returns:
+            Same as _get_response_from_provider
+        """
+        key = request_key(user_model, conversation_history)
+        messages = list(conversation_history)
+        try:
+            return await asyncio.wait_for(
+                request_coalescer.run(
+                    key,
+                    lambda shared_delta: self._get_response_from_provider(user_model, messages, on_delta=shared_delta),
+                    on_delta=on_delta
+                ),
+                timeout=deadline.timeout() if deadline else None
+            )
+        except asyncio.TimeoutError:
+            if deadline is None or not deadline.expired:
+                raise
+            deadline_stats.record('provider')
+            return {"error": f":x: **{lm.get('error_deadline_exceeded')}**"}
 
     async def _get_response_from_provider(
         self,
         user_model: str,
-        conversation_history: List[Dict[str, str]]
+        conversation_history: List[Dict[str, str]],
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None
     ) -> Dict[str, str]:
         """
-        Attempt providers in sequence, starting with the one that last successfully responded.
+        Attempt providers in order of their expected latency for this model,
+        skipping providers whose circuit breaker is open.
+
+        If the current provider has not answered within its historical latency
+        percentile, the same request is fired at the next provider and the
+        first successful answer wins; the slower request is cancelled. When
+        streaming, the race is decided by the first token instead.
 
         Args:
             user_model: The name of the model to use.
             conversation_history: The list of past messages (role/content dicts).
+            on_delta: Stream the completion and call this with the text received so far.
 
         Returns:
             A dict with either:
               - "bot_response": the text reply from the AI, or
               - "error": an error message if all providers failed.
         """
-        providers = list(self.providers_dict.get(user_model, []))
+        providers = provider_scoreboard.order(user_model, self.providers_dict.get(user_model, []))
+        pending: Dict[asyncio.Task, Any] = {}
         last_error = None
+        newest = None
+        streaming = on_delta is not None
+        claimed: asyncio.Future = asyncio.get_running_loop().create_future()
+
+        def claim() -> bool:
+            # The first provider to stream a token owns the reply
+            if claimed.done():
+                return claimed.result() is asyncio.current_task()
+            claimed.set_result(asyncio.current_task())
+            return True
+
+        def launch(hedge: bool = False) -> bool:
+            nonlocal newest, last_error
+            while providers:
+                provider = providers.pop(0)
+                if provider_breakers.available(provider):
+                    break
+                breaker = provider_breakers.get(provider)
+                logger.info(lm.get('log_circuit_skip').format(provider=breaker.name, state=breaker.state, retry_in=breaker.retry_in()))
+                last_error = last_error or lm.get('error_provider_circuit_open').format(provider=breaker.name)
+            else:
+                return False
+            task = asyncio.create_task(self._request_provider(
+                user_model, provider, conversation_history,
+                on_delta=on_delta, claim=claim if streaming else None
+            ))
+            if hedge:
+                task.add_done_callback(lambda _: hedge_limiter.release(user_model))
+            pending[task] = provider
+            newest = provider
+            return True
 
-        for provider in providers:
-            try:
-                logger.info(lm.get('log_provider_trying').format(provider=provider))
-
-                # get or create a client for this provider, with api_key if available
-                api_key = self.provider_api_keys.get(provider)
-                client_key = (provider, api_key)
-                client = self.clients_by_provider.get(client_key)
-                if not client:
-                    if api_key:
-                        client = AsyncClient(provider=provider, api_key=api_key)
-                    else:
-                        client = AsyncClient(provider=provider)
-                    self.clients_by_provider[client_key] = client
-
-                response = await client.chat.completions.create(
-                    model=user_model,
-                    messages=conversation_history,
-                    provider=provider
-                )
-
-                # on success, move this provider to the front of the list
-                lst = self.providers_dict[user_model]
-                lst.remove(provider)
-                lst.insert(0, provider)
-
-                return {"bot_response": response.choices[0].message.content}
-
-            except Exception as e:
-                logger.exception(lm.get('log_provider_failed').format(provider=provider, error=e))
-                last_error = e
+        try:
+            launch()
+            while pending:
+                # Wait for the newest attempt up to its latency percentile, then hedge
+                timeout = None
+                waiters = set(pending)
+                if not claimed.done():
+                    if self.hedge_enabled and providers:
+                        timeout = provider_scoreboard.hedge_delay(user_model, newest, self.hedge_percentile, streaming)
+                    if streaming:
+                        waiters.add(claimed)
+
+                done, _ = await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    if hedge_limiter.try_acquire(user_model, self.hedge_max_in_flight):
+                        slow_provider = newest
+                        if launch(hedge=True):
+                            logger.info(lm.get('log_provider_hedge').format(
+                                provider=get_provider_name(slow_provider),
+                                hedge=get_provider_name(newest),
+                                model=user_model,
+                                delay=timeout
+                            ))
+                        else:
+                            hedge_limiter.release(user_model)
+                    continue
+
+                if claimed in done:
+                    # A provider started streaming: stop the others and let it finish
+                    done.discard(claimed)
+                    for task in pending:
+                        if task is not claimed.result():
+                            task.cancel()
+
+                for task in done:
+                    pending.pop(task)
+                    if task.cancelled():
+                        continue
+                    if task.exception() is None:
+                        return {"bot_response": task.result()}
+                    last_error = task.exception()
+                    if claimed.done() and claimed.result() is task:
+                        # The streaming provider failed midway, let the next one take over
+                        claimed = asyncio.get_running_loop().create_future()
+
+                # Sequential failover once nothing is in flight
+                if not pending:
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
 
         return {
             "error": (
@@ -624,7 +1328,7 @@ class DiscordClient(discord.Client):
         providers = self.providers_dict.get(model)
         if providers is None or not providers:
             providers = self.default_provider.providers
-        return RetryProvider(providers, shuffle=False)
+        return RetryProvider(provider_scoreboard.order(model, providers), shuffle=False)
 
     async def reset_conversation_history(self, user_id: int) -> None:
         """
@@ -633,7 +1337,8 @@ class DiscordClient(discord.Client):
         Args:
             user_id: Discord user ID
         """
-        await self.save_user_data(user_id, {'history': [], 'model': self.default_model})
+        async with self.lock_conversation(user_id):
+            await self.save_user_data(user_id, {'history': [], 'model': self.default_model})
 
     async def set_user_model(self, user_id: int, model_name: str, vision_support: bool = False) -> None:
         """
@@ -644,10 +1349,11 @@ class DiscordClient(discord.Client):
             model_name: Model name
             vision_support: Whether the model supports vision
         """
-        user_data = await self.load_user_data(user_id)
-        user_data['model'] = model_name
-        user_data['vision_support'] = vision_support
-        await self.save_user_data(user_id, user_data)
+        async with self.lock_conversation(user_id):
+            user_data = await self.load_user_data(user_id)
+            user_data['model'] = model_name
+            user_data['vision_support'] = vision_support
+            await self.save_user_data(user_id, user_data)
 
     async def load_user_data(self, user_id: Optional[int], channel_id: Optional[int] = None) -> Dict[str, Any]:
         """
@@ -661,26 +1367,35 @@ class DiscordClient(discord.Client):
             User data dictionary
         """
 
-        if self.cache_enabled and user_id is not None:
-            cached = self.user_cache.get(user_id)
+        key = self.conversation_key(user_id, channel_id)
+        if self.cache_enabled:
+            cached = self.user_cache.get(key)
             if cached:
                 return cached
 
         filepath = await self.get_user_data_filepath(user_id, channel_id)
         data = None
 
+        pending = self.user_data_writer.get(filepath)
+        if pending is not None:
+            data = pending[2]
+            if self.cache_enabled:
+                self.user_cache.set(key, data)
+            return data
+
         try:
-            raw = await read_file(filepath)
-            if not raw:
+            data = await self.storage.load(filepath, user_id, channel_id)
+            if not data:
                 raise FileNotFoundError(lm.get('error_empty_file'))
 
-            try:
-                data = json.loads(raw)
-            except json.JSONDecodeError:
-                encryptor = await UserDataEncryptor(user_id, channel_id).initialize()
-                data = await encryptor.decrypt(raw)
-                if data is None:
-                    raise ValueError(lm.get('error_decryption_failed'))
+            if self.search_cleanup_enabled and data.get('history'):
+                data['history'], removed = strip_search_context(data['history'])
+                if removed:
+                    logger.info(lm.get('log_search_context_stripped').format(count=removed, filepath=filepath))
+            if data.get('history'):
+                data['history'], stripped = strip_reasoning(data['history'])
+                if stripped:
+                    logger.info(lm.get('log_reasoning_stripped').format(count=stripped, filepath=filepath))
         except Exception as e:
             logger.error(lm.get('log_load_data_error').format(error=e))
             data = None
@@ -698,15 +1413,15 @@ class DiscordClient(discord.Client):
             try:
                 await self.save_user_data(user_id, data, channel_id)
 
-                if channel_id is not None and channel_id == int(os.getenv("DISCORD_CHANNEL_ID", "")):
+                if key.kind == 'system':
                     logger.info(lm.get('log_new_system_file').format(filepath=filepath))
                 else:
                     logger.info(lm.get('log_new_data_file').format(filepath=filepath, user_id=user_id))
             except Exception as e:
                 logger.error(lm.get('file_write_error').format(filepath=filepath, error=e))
 
-        if self.cache_enabled and user_id is not None:
-            self.user_cache.set(user_id, data)
+        if self.cache_enabled:
+            self.user_cache.set(key, data)
         return data
 
     async def save_user_data(self, user_id: Optional[int], data: Dict[str, Any], channel_id: Optional[int] = None) -> None:
@@ -726,23 +1441,56 @@ class DiscordClient(discord.Client):
 
         filepath = await self.get_user_data_filepath(user_id, channel_id)
 
-        should_encrypt = (
+        if self.cache_enabled:
+            self.user_cache.set(self.conversation_key(user_id, channel_id), data)
+
+        if self.write_behind_enabled:
+            self.user_data_writer.mark_dirty(filepath, (user_id, channel_id, data))
+            return
+        await self._write_user_data(filepath, user_id, channel_id, data)
+
+    async def _write_user_data(self, filepath: str, user_id: Optional[int], channel_id: Optional[int], data: Dict[str, Any]) -> bool:
+        """
+        Write user data to the storage backend.
+
+        Returns:
+            True if the data was written
+        """
+        return await self.storage.save(filepath, user_id, channel_id, data)
+
+    async def _write_pending_user_data(self, filepath: str, pending: Tuple[Optional[int], Optional[int], Dict[str, Any]]) -> bool:
+        user_id, channel_id, data = pending
+        return await self._write_user_data(filepath, user_id, channel_id, data)
+
+    def _should_encrypt(self, channel_id: Optional[int]) -> bool:
+        """Whether data of a DM (channel_id None) or channel conversation is stored encrypted."""
+        return (
             channel_id is None and self.encrypt_user_data or
             channel_id is not None and self.encrypt_channels
         )
 
-        if should_encrypt:
-            encryptor = await UserDataEncryptor(user_id, channel_id).initialize()
-            raw = await encryptor.encrypt(data)
-            if not raw:
-                logger.error(lm.get('encryption_encrypt_error').format(error="Failed to encrypt data"))
+    async def _archive_reasoning(self, user_id: Optional[int], channel_id: Optional[int], model: str, reasoning: str) -> None:
+        """
+        Append a reply's reasoning to the conversation's archive, encrypted like its data.
+
+        Args:
+            user_id: Discord user ID
+            channel_id: Discord channel ID
+            model: Model that produced the reasoning
+            reasoning: Reasoning text
+        """
+        filename = os.path.basename(await self.get_user_data_filepath(user_id, channel_id))
+        filepath = os.path.join(REASONING_DIR, os.path.splitext(filename)[0] + '.jsonl')
+        record = {'timestamp': datetime.now().isoformat(), 'model': model, 'reasoning': reasoning}
+
+        if self._should_encrypt(channel_id):
+            line = await UserDataEncryptor(user_id, channel_id).encrypt(record)
+            if not line:
+                logger.error(lm.get('encryption_encrypt_error').format(error="Failed to encrypt reasoning"))
                 return
-            await write_file(filepath, raw)
         else:
-            await write_json(filepath, data)
-
-        if self.cache_enabled and user_id is not None:
-            self.user_cache.set(user_id, data)
+            line = json_dumps(record).decode('utf-8')
+        await append_file(filepath, line + '\n')
 
     async def set_user_instruction(self, user_id: int, instruction: str) -> None:
         """
@@ -752,12 +1500,13 @@ class DiscordClient(discord.Client):
             user_id: Discord user ID
             instruction: Instruction text
         """
-        user_data = await self.load_user_data(user_id)
-        user_data['history'] = [msg for msg in user_data.get('history', []) if msg['role'] not in ['system']]
-        if instruction:
-            user_data['history'].insert(0, {'role': 'system', 'content': instruction})
-        user_data['instruction'] = instruction
-        await self.save_user_data(user_id, user_data)
+        async with self.lock_conversation(user_id):
+            user_data = await self.load_user_data(user_id)
+            user_data['history'] = [msg for msg in user_data.get('history', []) if msg['role'] not in ['system']]
+            if instruction:
+                user_data['history'].insert(0, {'role': 'system', 'content': instruction})
+            user_data['instruction'] = instruction
+            await self.save_user_data(user_id, user_data)
 
     async def reset_user_instruction(self, user_id: int) -> None:
         """
@@ -766,10 +1515,41 @@ class DiscordClient(discord.Client):
         Args:
             user_id: Discord user ID
         """
-        user_data = await self.load_user_data(user_id)
-        user_data['history'] = [msg for msg in user_data.get('history', []) if msg['role'] not in ['system']]
-        user_data['instruction'] = ""
-        await self.save_user_data(user_id, user_data)
+        async with self.lock_conversation(user_id):
+            user_data = await self.load_user_data(user_id)
+            user_data['history'] = [msg for msg in user_data.get('history', []) if msg['role'] not in ['system']]
+            user_data['instruction'] = ""
+            await self.save_user_data(user_id, user_data)
+
+    def lock_conversation(self, user_id: Optional[int], channel_id: Optional[int] = None) -> AsyncContextManager:
+        """
+        Lock a conversation for a load, modify and save sequence.
+        
+        Args:
+            user_id: Discord user ID
+            channel_id: Discord channel ID, None for DMs
+            
+        Returns:
+            Async context manager holding the conversation's lock
+        """
+        return self.conversation_locks.lock(self.conversation_key(user_id, channel_id))
+
+    def conversation_key(self, user_id: Optional[int], channel_id: Optional[int] = None) -> ConversationKey:
+        """
+        Get the identity of the conversation a request belongs to.
+        
+        Args:
+            user_id: Discord user ID
+            channel_id: Discord channel ID, None for DMs
+            
+        Returns:
+            ConversationKey of the system channel, a guild channel or a user's DMs
+        """
+        if channel_id is None:
+            return ConversationKey('user', user_id)
+        if channel_id == self.system_channel_id:
+            return ConversationKey('system', channel_id)
+        return ConversationKey('channel', channel_id)
 
     async def get_user_data_filepath(self, user_id: Optional[int], channel_id: Optional[int] = None) -> str:
         """
@@ -782,15 +1562,13 @@ class DiscordClient(discord.Client):
         Returns:
             Filepath string
         """
+        key = self.conversation_key(user_id, channel_id)
         # For system channel, use system.json
-        if channel_id is not None and channel_id == int(os.getenv("DISCORD_CHANNEL_ID", "")):
+        if key.kind == 'system':
             filename = SYSTEM_DATA_FILE
-        # For DMs, use user-specific file with encryption
-        elif channel_id is None:
-            filename = f'user_{user_id}.json'
-        # For other channels, use channel-specific file without encryption
+        # For DMs, use user-specific file with encryption; for other channels, channel-specific file
         else:
-            filename = f'channel_{channel_id}.json'
+            filename = f'{key.kind}_{key.id}.json'
             
         filepath = os.path.join(USER_DATA_DIR, filename)
         return filepath
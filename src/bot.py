@@ -1,7 +1,6 @@
 import os
 import base64
-import asyncio
-import requests
+import aiohttp
 from docling.document_converter import DocumentConverter
 import logging
 
@@ -21,11 +20,8 @@ from src.aclient import discordClient
 from src.agents_presets import AGENTS
 from utils.files_utils import read_file, write_json, save_attachment_to_file
 from utils.ban_utils import ban_manager
-
-# g4f
-from g4f.client import AsyncClient
-
-client = AsyncClient()
+from utils.rate_limit_utils import rate_limiter, request_cost
+from utils.deadline_utils import Deadline
 
 # --- models list with vision support flag ---
 MODELS = [
@@ -121,6 +117,9 @@ async def run_discord_bot():
             return
         if interaction.user == discordClient.user:
             return
+        buckets = ['ask', 'search'] if request_type else ['ask']
+        if await rate_limiter.check_and_respond(interaction, buckets, request_cost('ask', request_type, has_file=file is not None)):
+            return
 
         combined_message = message
 
@@ -148,13 +147,14 @@ async def run_discord_bot():
 
                 # Получить изображение напрямую с CDN
                 try:
-                    response = requests.get(file.url, stream=True, timeout=10)
-                    response.raise_for_status()
+                    async with discordClient.http_clients.session().get(file.url, timeout=aiohttp.ClientTimeout(total=10)) as response:
+                        response.raise_for_status()
+                        image = await response.read()
                     
-                    ai_response = await client.chat.completions.create(
+                    ai_response = await discordClient.http_clients.ai_client().chat.completions.create(
                         model=model,
                         messages=[{"role": "user", "content": message}],
-                        image=response.raw
+                        image=image
                     )
                     result = ai_response.choices[0].message.content
                     await interaction.followup.send(result)
@@ -214,7 +214,9 @@ async def run_discord_bot():
             channel=interaction.channel
         ))
 
-        asyncio.create_task(discordClient.send_message(interaction, combined_message, request_type))
+        # The interaction token lives 15 minutes from creation, file processing already used part of it
+        deadline = Deadline.after(discordClient.request_deadline, since=interaction.created_at)
+        await discordClient.schedule_message(interaction, combined_message, request_type, deadline=deadline)
 
     @discordClient.tree.command(name="chat-model", description=lm.get('chat_model_description'))
     async def chat_model(interaction: discord.Interaction):
@@ -638,7 +640,7 @@ async def run_discord_bot():
             filename = f"history_{channel_id or user_id}.json"
             temp_filepath = os.path.join(temp_dir, filename)
 
-            await write_json(temp_filepath, history_list)
+            await write_json(temp_filepath, history_list, indent=4)
 
             try:
                 with open(temp_filepath, 'rb') as file:
@@ -684,7 +686,7 @@ async def run_discord_bot():
 
             images_data = []
             for _ in range(count):
-                response = await client.images.generate(model=image_model, prompt=prompt, response_format="b64_json")
+                response = await discordClient.http_clients.ai_client().images.generate(model=image_model, prompt=prompt, response_format="b64_json")
 
                 if response.data:
                     base64_text = response.data[0].b64_json
@@ -755,6 +757,9 @@ async def run_discord_bot():
         if interaction.user == discordClient.user:
             return
 
+        if await rate_limiter.check_and_respond(interaction, ['draw'], request_cost('draw', count=count)):
+            return
+
         username = str(interaction.user)
         channel = str(interaction.channel)
         logger.info(lm.get('log_user_draw').format(
@@ -1127,6 +1132,8 @@ async def run_discord_bot():
             clean_message = message.content.replace(f'<@{discordClient.user.id}>', '').strip()
 
             if clean_message:
+                if await rate_limiter.check_and_respond(message, ['mention'], request_cost('mention')):
+                    return
                 discordClient.current_channel = message.channel
 
                 logger.info(lm.get('log_bot_mention').format(
@@ -1134,7 +1141,12 @@ async def run_discord_bot():
                     message=clean_message,
                     channel=message.channel
                 ))
-                asyncio.create_task(discordClient.send_message(message, clean_message, None))
+                deadline = Deadline.after(discordClient.request_deadline, since=message.created_at)
+                await discordClient.schedule_message(message, clean_message, None, deadline=deadline)
 
     TOKEN = os.getenv("DISCORD_BOT_TOKEN")
-    await discordClient.start(TOKEN)
+    try:
+        await discordClient.start(TOKEN)
+    finally:
+        if not discordClient.is_closed():
+            await discordClient.close()
@@ -1,9 +1,10 @@
 import os
+import json
 import discord
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple, Any
 from dataclasses import dataclass
-from utils.files_utils import read_json, write_json
+from utils.files_utils import read_json, write_json, run_blocking
 from src.log import logger
 from src.locale_manager import locale_manager as lm
 
@@ -50,8 +51,24 @@ class BanManager:
         os.makedirs(bans_dir, exist_ok=True)
         self.admin_id = int(os.getenv('ADMIN_ID', 0))
         self._ban_cleanup_running = False
+        # In-memory copy of the ban files, so checking a request needs no disk access
+        self._bans: Dict[int, BanData] = self._load_bans()
         logger.info(lm.get('ban_manager_start'))
 
+    def _load_bans(self) -> Dict[int, BanData]:
+        """Read all ban files."""
+        bans = {}
+        for filename in os.listdir(self.bans_dir):
+            if not filename.endswith('_ban.json'):
+                continue
+            try:
+                with open(os.path.join(self.bans_dir, filename), 'r', encoding='utf-8') as f:
+                    ban_data = BanData.from_dict(json.load(f))
+                bans[ban_data.user_id] = ban_data
+            except Exception as e:
+                logger.error(lm.get('is_user_banned_error').format(user_id=filename.split('_')[0], error=e))
+        return bans
+
     async def get_ban_filepath(self, user_id: int) -> str:
         """Get the filepath for a user's ban data."""
         return os.path.join(self.bans_dir, f'{user_id}_ban.json')
@@ -81,7 +98,10 @@ class BanManager:
         )
 
         try:
-            await write_json(ban_file, ban_data.to_dict())
+            # The in-memory ban must not outlive a restart, so it follows the file
+            if not await write_json(ban_file, ban_data.to_dict()):
+                raise OSError(lm.get('ban_file_write_failed').format(filepath=ban_file))
+            self._bans[user_id] = ban_data
             logger.info(lm.get('ban_user_success').format(user_id=user_id, reason=reason))
         except Exception as e:
             logger.error(lm.get('ban_user_error').format(user_id=user_id, error=e))
@@ -94,6 +114,7 @@ class BanManager:
         if os.path.exists(ban_file):
             try:
                 os.remove(ban_file)
+                self._bans.pop(user_id, None)
                 if auto:
                     logger.info(lm.get('ban_user_auto_unbanned').format(user_id=user_id))
                 else:
@@ -103,6 +124,7 @@ class BanManager:
                 logger.error(lm.get('unban_user_error').format(user_id=user_id, error=e))
                 raise
         
+        self._bans.pop(user_id, None)
         return False
 
     async def get_ban_message(self, ban_data: BanData, target_user_id: int, is_self_check: bool) -> Dict[str, Any]:
@@ -126,16 +148,8 @@ class BanManager:
 
     async def is_user_banned(self, user_id: int, is_self_check: bool = True) -> Tuple[bool, Optional[Dict[str, Any]]]:
         """Check if a user is banned and get ban information."""
-        ban_file = await self.get_ban_filepath(user_id)
-        
-        if not os.path.exists(ban_file):
-            return False, None
-
-        try:
-            data = await read_json(ban_file)
-            ban_data = BanData.from_dict(data)
-        except Exception as e:
-            logger.error(lm.get('is_user_banned_error').format(user_id=user_id, error=e))
+        ban_data = self._bans.get(user_id)
+        if ban_data is None:
             return False, None
 
         if ban_data.is_expired():
@@ -201,7 +215,8 @@ class BanManager:
         return banned_users
 
     async def cleanup_expired_bans(self) -> None:
-        """Clean up all expired bans."""
+        """Clean up all expired bans, picking up ban files changed outside the bot."""
+        self._bans = await run_blocking(self._load_bans)
         for filename in os.listdir(self.bans_dir):
             if filename.endswith('_ban.json'):
                 try:
@@ -0,0 +1,140 @@
+import os
+import gzip
+import time
+import threading
+from typing import Any, Dict, Optional
+from src.log import logger
+from src.locale_manager import locale_manager as lm
+
+# Optional zstd support, gzip is used instead when it is not installed
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Constants
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+MIN_COMPRESS_BYTES = 1024   # smaller payloads are stored as they are
+DEFAULT_LEVELS = {'gzip': 6, 'zstd': 3}
+CODECS = ('none', 'gzip', 'zstd')
+
+def detect_codec(data: bytes) -> str:
+    """
+    Detect the compression of stored bytes by their magic number.
+
+    Args:
+        data: Stored payload
+
+    Returns:
+        "gzip", "zstd" or "none" for plain JSON and anything else
+    """
+    if data[:2] == GZIP_MAGIC:
+        return 'gzip'
+    if data[:4] == ZSTD_MAGIC:
+        return 'zstd'
+    return 'none'
+
+class Compressor:
+    """
+    Compresses stored payloads with the configured codec and decompresses any supported one.
+
+    Reading never depends on the configured codec, so switching codecs or
+    turning compression off keeps existing files readable.
+    """
+
+    def __init__(self, codec: Optional[str] = None, level: Optional[int] = None):
+        """
+        Args:
+            codec: "none", "gzip" or "zstd", STORAGE_COMPRESSION env when omitted
+            level: Compression level, STORAGE_COMPRESSION_LEVEL env or the codec's default when omitted
+        """
+        codec = (codec or os.getenv('STORAGE_COMPRESSION', 'none')).lower()
+        if codec not in CODECS:
+            logger.warning(lm.get('log_compression_unknown_codec').format(codec=codec))
+            codec = 'none'
+        if codec == 'zstd' and zstandard is None:
+            logger.warning(lm.get('log_compression_zstd_missing'))
+            codec = 'gzip'
+        self.codec = codec
+        self.level = level or int(os.getenv('STORAGE_COMPRESSION_LEVEL', 0)) or DEFAULT_LEVELS.get(codec, 0)
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.compressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.compress_time = 0.0
+        self.decompressed = 0
+        self.decompress_time = 0.0
+
+    def compress(self, data: bytes) -> bytes:
+        """
+        Compress a payload with the configured codec.
+
+        Args:
+            data: Serialized payload
+
+        Returns:
+            Compressed payload, or the payload itself if compression is off or it is small
+        """
+        if self.codec == 'none' or len(data) < MIN_COMPRESS_BYTES:
+            return data
+
+        start = time.perf_counter()
+        if self.codec == 'zstd':
+            compressed = zstandard.ZstdCompressor(level=self.level).compress(data)
+        else:
+            compressed = gzip.compress(data, compresslevel=self.level, mtime=0)
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.compressed += 1
+            self.bytes_in += len(data)
+            self.bytes_out += len(compressed)
+            self.compress_time += elapsed
+        return compressed
+
+    def decompress(self, data: bytes) -> bytes:
+        """
+        Decompress a payload written by any supported codec.
+
+        Args:
+            data: Stored payload
+
+        Returns:
+            Decompressed payload, or the payload itself if it is not compressed
+
+        Raises:
+            ValueError: If the payload is zstd compressed and zstandard is not installed
+        """
+        codec = detect_codec(data)
+        if codec == 'none':
+            return data
+
+        start = time.perf_counter()
+        if codec == 'zstd':
+            if zstandard is None:
+                raise ValueError(lm.get('log_compression_zstd_missing'))
+            data = zstandard.ZstdDecompressor().decompressobj().decompress(data)
+        else:
+            data = gzip.decompress(data)
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.decompressed += 1
+            self.decompress_time += elapsed
+        return data
+
+    def stats(self) -> Dict[str, Any]:
+        """Compression ratio and time spent in the codec."""
+        with self._lock:
+            return {
+                'codec': self.codec,
+                'compressed': self.compressed,
+                'ratio': self.bytes_in / self.bytes_out if self.bytes_out else 1.0,
+                'saved': self.bytes_in - self.bytes_out,
+                'compress_ms': self.compress_time / self.compressed * 1000 if self.compressed else 0.0,
+                'decompressed': self.decompressed,
+                'decompress_ms': self.decompress_time / self.decompressed * 1000 if self.decompressed else 0.0
+            }
@@ -0,0 +1,90 @@
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from src.log import logger
+from src.locale_manager import locale_manager as lm
+
+# Constants
+REQUEST_DEADLINE = 14 * 60  # Discord interaction tokens expire after 15 minutes, keep a margin
+
+class DeadlineExceeded(Exception):
+    """Raised when a request has no time left for the next stage."""
+    pass
+
+class Deadline:
+    """Absolute point in time by which a request must be answered."""
+
+    def __init__(self, expires_at: float):
+        """
+        Args:
+            expires_at: time.monotonic() value at which the request expires
+        """
+        self.expires_at = expires_at
+
+    @classmethod
+    def after(cls, seconds: Optional[float] = None, since: Optional[datetime] = None) -> 'Deadline':
+        """
+        Create a deadline.
+
+        Args:
+            seconds: Time budget, REQUEST_DEADLINE env or default when omitted
+            since: Aware datetime the budget started at (e.g. interaction.created_at), now when omitted
+
+        Returns:
+            Deadline instance
+        """
+        if seconds is None:
+            seconds = float(os.getenv('REQUEST_DEADLINE', REQUEST_DEADLINE))
+        if since is not None:
+            seconds -= max(0.0, (datetime.now(timezone.utc) - since).total_seconds())
+        return cls(time.monotonic() + seconds)
+
+    def remaining(self) -> float:
+        """Seconds left, never negative."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, cap: Optional[float] = None) -> float:
+        """
+        Time budget for the next stage.
+
+        Args:
+            cap: Stage's own timeout, if any
+
+        Returns:
+            The smaller of the remaining time and cap
+        """
+        remaining = self.remaining()
+        return remaining if cap is None else min(remaining, cap)
+
+    def check(self, stage: str) -> None:
+        """
+        Raise DeadlineExceeded (and count it) if the deadline has passed.
+
+        Args:
+            stage: Name of the stage about to start, for logs and counters
+        """
+        if self.expired:
+            deadline_stats.record(stage)
+            raise DeadlineExceeded(lm.get('error_deadline_exceeded'))
+
+class DeadlineStats:
+    """Counts requests abandoned because their deadline passed, per stage."""
+
+    def __init__(self):
+        self.abandoned: Dict[str, int] = {}
+
+    def record(self, stage: str) -> None:
+        self.abandoned[stage] = self.abandoned.get(stage, 0) + 1
+        logger.warning(lm.get('log_deadline_exceeded').format(
+            stage=stage,
+            count=self.abandoned[stage],
+            total=sum(self.abandoned.values())
+        ))
+
+# Global instance
+deadline_stats = DeadlineStats()
@@ -5,7 +5,7 @@ from typing import Optional, Any
 from dataclasses import dataclass
 from cryptography.fernet import Fernet, InvalidToken
 from src.log import logger
-from utils.files_utils import read_json, write_json
+from utils.files_utils import read_json, write_json, json_dumps, json_loads
 from src.locale_manager import locale_manager as lm
 
 @dataclass
@@ -72,15 +72,14 @@ class UserDataEncryptor:
     async def encrypt(self, data: Any) -> Optional[str]:
         """Encrypt data and return as base64 encoded string."""
         if self.channel_id is not None:
-            return json.dumps(data, ensure_ascii=False)
+            return json_dumps(data).decode('utf-8')
 
         await self.initialize()        
         if not self.cipher_suite:
             return None
         
         try:
-            json_data = json.dumps(data, ensure_ascii=False)
-            encrypted_data = self.cipher_suite.encrypt(json_data.encode('utf-8'))
+            encrypted_data = self.cipher_suite.encrypt(json_dumps(data))
             return base64.urlsafe_b64encode(encrypted_data).decode('utf-8')
         except Exception as e:
             logger.error(lm.get('encryption_encrypt_error').format(error=e))
@@ -90,7 +89,7 @@ class UserDataEncryptor:
         """Decrypt base64 encoded string back to original data."""
         if self.channel_id is not None:
             try:
-                return json.loads(encrypted_data)
+                return json_loads(encrypted_data)
             except json.JSONDecodeError as e:
                 logger.error(lm.get('encryption_invalid_json').format(error=e))
                 return None
@@ -102,7 +101,7 @@ class UserDataEncryptor:
         try:
             decoded_data = base64.urlsafe_b64decode(encrypted_data.encode('utf-8'))
             decrypted_data = self.cipher_suite.decrypt(decoded_data)
-            return json.loads(decrypted_data.decode('utf-8'))
+            return json_loads(decrypted_data)
         except InvalidToken:
             logger.error(lm.get('encryption_invalid_token'))
             return None
@@ -113,6 +112,39 @@ class UserDataEncryptor:
             logger.error(lm.get('encryption_decrypt_error').format(error=e))
             return None
 
+    async def encrypt_bytes(self, payload: bytes) -> Optional[bytes]:
+        """Encrypt an already serialized (and possibly compressed) payload into the stored format."""
+        if self.channel_id is not None:
+            return payload
+
+        await self.initialize()
+        if not self.cipher_suite:
+            return None
+
+        try:
+            return base64.urlsafe_b64encode(self.cipher_suite.encrypt(payload))
+        except Exception as e:
+            logger.error(lm.get('encryption_encrypt_error').format(error=e))
+            return None
+
+    async def decrypt_bytes(self, encrypted_data: bytes) -> Optional[bytes]:
+        """Decrypt stored data back to its serialized payload."""
+        if self.channel_id is not None:
+            return encrypted_data
+
+        await self.initialize()
+        if not self.cipher_suite:
+            return None
+
+        try:
+            return self.cipher_suite.decrypt(base64.urlsafe_b64decode(encrypted_data))
+        except InvalidToken:
+            logger.error(lm.get('encryption_invalid_token'))
+            return None
+        except Exception as e:
+            logger.error(lm.get('encryption_decrypt_error').format(error=e))
+            return None
+
     async def rotate_key(self) -> bool:
         """Rotate the encryption key and re-encrypt data if needed."""
         await self.initialize()        
@@ -7,6 +7,16 @@ from typing import Any, Optional, Union
 from src.log import logger
 from src.locale_manager import locale_manager as lm
 
+# Optional accelerated JSON codecs, stdlib json is used when neither is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
 # Fix potential overload for import os functions... maybe its not perfect but more stable
 async def run_blocking(fn, *args, **kwargs):
     return await asyncio.to_thread(fn, *args, **kwargs)
@@ -28,6 +38,79 @@ async def ensure_directory(dirpath: Union[str]) -> bool:
         logger.error(lm.get('directory_create_error').format(directory=dirpath, error=e))
         return False
 
+def json_dumps(data: Any, indent: Optional[int] = None, sort_keys: bool = False) -> bytes:
+    """
+    Serialize data to UTF-8 JSON bytes with the fastest available codec.
+
+    Args:
+        data: Data to serialize
+        indent: Indentation for human-readable output, None for compact output
+        sort_keys: Sort object keys, e.g. for hashing
+
+    Returns:
+        Encoded JSON
+    """
+    if orjson is not None and indent in (None, 2):
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(data, option=option)
+        except TypeError:
+            pass  # e.g. integers beyond 64 bit, stdlib json handles them
+    elif msgspec is not None and indent is None and not sort_keys:
+        try:
+            return msgspec.json.encode(data)
+        except (TypeError, OverflowError):
+            pass
+    separators = None if indent else (',', ':')
+    return json.dumps(data, ensure_ascii=False, indent=indent, sort_keys=sort_keys, separators=separators).encode('utf-8')
+
+def json_loads(raw: Union[str, bytes]) -> Any:
+    """
+    Parse JSON text or bytes with the fastest available codec.
+
+    Args:
+        raw: JSON document, compact or indented
+
+    Returns:
+        Parsed data
+
+    Raises:
+        json.JSONDecodeError: If the document is not valid JSON
+    """
+    if orjson is not None:
+        return orjson.loads(raw)
+    if msgspec is not None:
+        try:
+            return msgspec.json.decode(raw)
+        except msgspec.DecodeError as e:
+            raise json.JSONDecodeError(str(e), raw if isinstance(raw, str) else '', 0) from e
+    return json.loads(raw)
+
+async def read_bytes(filepath: Union[str]) -> Optional[bytes]:
+    """
+    Read the raw content of a file asynchronously.
+
+    Args:
+        filepath: Path to the file to read
+
+    Returns:
+        File content as bytes or None if file doesn't exist or error occurs
+    """
+    exists = await run_blocking(os.path.exists, filepath)
+    if not exists:
+        return None
+
+    try:
+        async with aiofiles.open(filepath, 'rb') as f:
+            return await f.read()
+    except Exception as e:
+        logger.error(lm.get('file_read_error').format(filepath=filepath, error=e))
+        return None
+
 async def read_file(filepath: Union[str], encoding: str = 'utf-8') -> Optional[str]:
     """
     Read content from a file asynchronously.
@@ -86,7 +169,7 @@ async def write_file(
                 await f.write(content)
         return True
     except Exception as e:
-        key = 'file_write_error' if mode == 'w' else 'file_append_error'
+        key = 'file_append_error' if 'a' in mode else 'file_write_error'
         logger.error(lm.get(key).format(filepath=filepath, error=e))
         return False
 
@@ -138,11 +221,11 @@ async def read_json(filepath: Union[str]) -> Optional[Any]:
     Returns:
         Parsed JSON data or None if file doesn't exist or error occurs
     """
-    text = await read_file(filepath)
-    if text is None:
+    raw = await read_bytes(filepath)
+    if raw is None:
         return None
     try:
-        return json.loads(text)
+        return json_loads(raw)
     except json.JSONDecodeError as e:
         logger.error(lm.get('file_json_read_error').format(filepath=filepath, error=e))
         return None
@@ -150,22 +233,24 @@ async def read_json(filepath: Union[str]) -> Optional[Any]:
 async def write_json(
     filepath: Union[str],
     data: Any,
-    indent: int = 4
+    indent: Optional[int] = None
 ) -> bool:
     """
     Write data as JSON to a file asynchronously.
 
+    Files are compact by default; pass an indent for files meant to be read by people.
+
     Args:
         filepath: Path to the JSON file
         data: Data to write as JSON
-        indent: JSON indentation level (default: 4)
+        indent: JSON indentation level (default: None, compact)
 
     Returns:
         True if successful, False otherwise
     """
     try:
-        content = json.dumps(data, ensure_ascii=False, indent=indent)
-        return await write_file(filepath, content)
+        content = json_dumps(data, indent=indent)
+        return await write_file(filepath, content, mode='wb')
     except Exception as e:
         logger.error(lm.get('file_json_write_error').format(filepath=filepath, error=e))
         return False
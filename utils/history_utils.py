@@ -0,0 +1,365 @@
+import os
+import asyncio
+import time
+import hashlib
+import contextlib
+from collections import OrderedDict
+from typing import Any, AsyncContextManager, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from src.log import logger
+from src.locale_manager import locale_manager as lm
+from utils.message_utils import extract_thinking
+
+# Constants
+CHARS_PER_TOKEN = 4  # Latin text and code
+NON_ASCII_CHARS_PER_TOKEN = 2  # Cyrillic and other scripts split into more tokens
+MESSAGE_OVERHEAD = 4  # Role and separators added by the chat format
+TOKEN_CACHE_SIZE = 20000
+DEFAULT_TOKEN_BUDGET = 12000
+COMPACT_AT = 0.75  # Fold old turns into the summary once history exceeds this share of the budget
+COMPACT_TO = 0.5  # ...until it is back under this share
+COMPACTION_QUEUE_LIMIT = 200  # Max aged-out messages waiting for the summarizer
+SUMMARY_MAX_CHARS = 4000
+
+# Prompt budgets per model; kept well under the context windows because
+# long prompts are what makes providers slow or fail
+MODEL_TOKEN_BUDGETS = {
+    'gpt-3.5-turbo': 6000,
+    'gpt-4.1-nano': 8000,
+    'command-r7b-12-2024': 6000,
+    'llama-3.2-11b': 4000,
+    'phi-4': 6000,
+    'glm-4': 6000,
+    'gpt-4o': 16000,
+    'gpt-4.1': 16000,
+    'claude-3.7-sonnet': 16000,
+    'gemini-1.5-pro': 16000,
+    'qwen-2.5-1m': 24000,
+}
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the token count of a text without a tokenizer.
+
+    Args:
+        text: Text to measure
+
+    Returns:
+        Approximate number of tokens
+    """
+    if not text:
+        return 0
+    non_ascii = sum(1 for char in text if ord(char) > 127)
+    ascii_chars = len(text) - non_ascii
+    return ascii_chars // CHARS_PER_TOKEN + non_ascii // NON_ASCII_CHARS_PER_TOKEN + 1
+
+def parse_token_budgets(value: str) -> Dict[str, int]:
+    """
+    Parse a "model=tokens,model=tokens" string.
+
+    Args:
+        value: Raw HISTORY_TOKEN_BUDGETS value
+
+    Returns:
+        Dict of model name to token budget
+    """
+    budgets = {}
+    for item in value.split(','):
+        model, _, tokens = item.partition('=')
+        if model.strip() and tokens.strip().isdigit():
+            budgets[model.strip()] = int(tokens)
+    return budgets
+
+class HistoryWindow:
+    """Trims conversation history to a per-model token budget."""
+
+    def __init__(self, default_budget: Optional[int] = None, budgets: Optional[Dict[str, int]] = None):
+        """
+        Args:
+            default_budget: Budget for models without their own, HISTORY_TOKEN_BUDGET env when omitted
+            budgets: Per-model budgets, MODEL_TOKEN_BUDGETS updated with HISTORY_TOKEN_BUDGETS env when omitted
+        """
+        self.default_budget = default_budget or int(os.getenv('HISTORY_TOKEN_BUDGET', DEFAULT_TOKEN_BUDGET))
+        if budgets is None:
+            budgets = {**MODEL_TOKEN_BUDGETS, **parse_token_budgets(os.getenv('HISTORY_TOKEN_BUDGETS', ''))}
+        self.budgets = budgets
+        # content digest -> tokens; only the digest is kept, never the message itself
+        self.token_cache: 'OrderedDict[bytes, int]' = OrderedDict()
+
+    def budget_for(self, model: str) -> int:
+        """Token budget for a model."""
+        return self.budgets.get(model, self.default_budget)
+
+    def message_tokens(self, message: Dict[str, Any]) -> int:
+        """
+        Token estimate of a single message, cached by content.
+
+        Args:
+            message: Role/content dict
+
+        Returns:
+            Approximate number of tokens
+        """
+        content = str(message.get('content') or '')
+        key = hashlib.blake2b(content.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+        cached = self.token_cache.get(key)
+        if cached is not None:
+            self.token_cache.move_to_end(key)
+            return cached
+
+        tokens = estimate_tokens(content) + MESSAGE_OVERHEAD
+        self.token_cache[key] = tokens
+        if len(self.token_cache) > TOKEN_CACHE_SIZE:
+            self.token_cache.popitem(last=False)
+        return tokens
+
+    def count(self, history: List[Dict[str, Any]]) -> int:
+        """Token estimate of a whole history."""
+        return sum(self.message_tokens(message) for message in history)
+
+    def trim(
+        self,
+        history: List[Dict[str, Any]],
+        model: str,
+        max_messages: Optional[int] = None,
+        budget: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Keep the system message and as many of the most recent messages as fit the model's budget.
+
+        The latest message is always kept, even if it alone exceeds the budget.
+
+        Args:
+            history: Conversation history, oldest first
+            model: Model the history will be sent to
+            max_messages: Optional cap on the number of kept messages, system message included
+            budget: Token budget, the model's own when omitted
+
+        Returns:
+            Tuple of (kept history, dropped messages), both oldest first
+        """
+        budget = budget or self.budget_for(model)
+        system_message = next((msg for msg in history if msg.get('role') == 'system'), None)
+        rest = [msg for msg in history if msg is not system_message]
+
+        used = self.message_tokens(system_message) if system_message else 0
+        slots = max_messages - (1 if system_message else 0) if max_messages else len(rest)
+        start = len(rest)
+        while start > 0:
+            tokens = self.message_tokens(rest[start - 1])
+            if start < len(rest) and (len(rest) - start >= slots or used + tokens > budget):
+                break
+            used += tokens
+            start -= 1
+
+        if start == 0:
+            return history, []
+
+        kept = ([system_message] if system_message else []) + rest[start:]
+        dropped = rest[:start]
+        logger.info(lm.get('log_history_windowed').format(
+            model=model,
+            kept=len(kept),
+            dropped=len(dropped),
+            tokens=used,
+            budget=budget
+        ))
+        return kept, dropped
+
+    def compact(
+        self,
+        history: List[Dict[str, Any]],
+        model: str,
+        max_messages: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Like trim, but once the history passes COMPACT_AT of the budget it is cut
+        down to COMPACT_TO, so aged-out turns leave in batches worth summarizing.
+        The message cap works the same way: a history over max_messages is cut
+        down to COMPACT_TO of it instead of losing one turn at a time.
+
+        Args:
+            history: Conversation history, oldest first
+            model: Model the history will be sent to
+            max_messages: Optional cap on the number of kept messages, system message included
+
+        Returns:
+            Tuple of (kept history, aged-out messages), both oldest first
+        """
+        budget = self.budget_for(model)
+        if max_messages and len(history) > max_messages:
+            max_messages = max(int(max_messages * COMPACT_TO), 2)
+        if self.count(history) > budget * COMPACT_AT:
+            budget = int(budget * COMPACT_TO)
+        return self.trim(history, model, max_messages, budget=budget)
+
+def split_reasoning(content: str) -> Tuple[Optional[str], str]:
+    """
+    Separate a reply's reasoning block from its final answer, using the
+    same patterns as message display.
+
+    Args:
+        content: Raw model reply
+
+    Returns:
+        Tuple of (reasoning or None, answer); the answer is the raw reply if nothing else is left
+    """
+    thinking, answer = extract_thinking(content)
+    if thinking is None or not answer:
+        return None, content
+    return thinking, answer
+
+def strip_reasoning(history: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Keep only the final answer of stored assistant messages.
+
+    Args:
+        history: Conversation history
+
+    Returns:
+        Tuple of (normalized history, number of changed messages)
+    """
+    changed = 0
+    normalized = []
+    for msg in history:
+        if msg.get('role') == 'assistant' and isinstance(msg.get('content'), str):
+            thinking, answer = split_reasoning(msg['content'])
+            if thinking is not None:
+                msg = {**msg, 'content': answer}
+                changed += 1
+        normalized.append(msg)
+    return normalized, changed
+
+def with_summary(history: List[Dict[str, Any]], summary: str) -> List[Dict[str, Any]]:
+    """
+    Insert the rolling summary right after the system message.
+
+    Args:
+        history: Conversation history
+        summary: Summary of the turns no longer in the history
+
+    Returns:
+        New history list to send to the model
+    """
+    if not summary:
+        return history
+    summary_message = {'role': 'system', 'content': lm.get('history_summary_prefix').format(summary=summary)}
+    position = 1 if history and history[0].get('role') == 'system' else 0
+    return history[:position] + [summary_message] + history[position:]
+
+def build_summary_prompt(summary: str, messages: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """
+    Build the request asking a model to fold new turns into the existing summary.
+
+    Args:
+        summary: Current summary, may be empty
+        messages: Aged-out turns, oldest first
+
+    Returns:
+        Conversation to send to the summary model
+    """
+    transcript = '\n\n'.join(f"{msg.get('role')}: {msg.get('content')}" for msg in messages)
+    return [
+        {'role': 'system', 'content': lm.get('history_summary_instruction').format(max_chars=SUMMARY_MAX_CHARS)},
+        {'role': 'user', 'content': lm.get('history_summary_request').format(
+            summary=summary or lm.get('history_summary_empty'),
+            transcript=transcript
+        )}
+    ]
+
+class HistoryCompactor:
+    """Folds aged-out turns into each conversation's rolling summary, off the request path."""
+
+    def __init__(
+        self,
+        summarize_func: Callable[[List[Dict[str, str]]], Awaitable[str]],
+        load_func: Callable[[Optional[int], Optional[int]], Awaitable[Dict[str, Any]]],
+        save_func: Callable[[Optional[int], Dict[str, Any], Optional[int]], Awaitable[None]],
+        lock_func: Optional[Callable[[Optional[int], Optional[int]], AsyncContextManager]] = None
+    ):
+        """
+        Args:
+            summarize_func: Sends a prompt to the summary model and returns its text
+            load_func: Loads user data for (user_id, channel_id)
+            save_func: Saves user data for (user_id, data, channel_id)
+            lock_func: Locks the conversation of (user_id, channel_id) while the summary is stored
+        """
+        self.summarize_func = summarize_func
+        self.load_func = load_func
+        self.save_func = save_func
+        self.lock_func = lock_func
+        self.queue: 'asyncio.Queue[Tuple[Optional[int], Optional[int]]]' = asyncio.Queue()
+        self.scheduled: Set[Tuple[Optional[int], Optional[int]]] = set()
+
+    def enqueue(self, user_data: Dict[str, Any], dropped: List[Dict[str, Any]]) -> None:
+        """
+        Add aged-out messages to a conversation's compaction queue.
+
+        Args:
+            user_data: Conversation data, modified in place
+            dropped: Messages that left the history window
+        """
+        queue = user_data.get('compaction_queue', []) + dropped
+        if len(queue) > COMPACTION_QUEUE_LIMIT:
+            logger.warning(lm.get('log_compaction_queue_overflow').format(count=len(queue) - COMPACTION_QUEUE_LIMIT))
+            queue = queue[-COMPACTION_QUEUE_LIMIT:]
+        user_data['compaction_queue'] = queue
+
+    def schedule(self, user_id: Optional[int], channel_id: Optional[int] = None) -> None:
+        """Queue a conversation for compaction unless it is already queued."""
+        key = (user_id, channel_id)
+        if key not in self.scheduled:
+            self.scheduled.add(key)
+            self.queue.put_nowait(key)
+
+    async def run_once(self) -> None:
+        """Wait for the next scheduled conversation and compact it."""
+        user_id, channel_id = await self.queue.get()
+        self.scheduled.discard((user_id, channel_id))
+        await self.compact(user_id, channel_id)
+
+    async def compact(self, user_id: Optional[int], channel_id: Optional[int] = None) -> None:
+        """
+        Summarize a conversation's queued turns into its rolling summary.
+
+        Args:
+            user_id: Discord user ID, None for channel conversations
+            channel_id: Discord channel ID
+        """
+        user_data = await self.load_func(user_id, channel_id)
+        queued = list(user_data.get('compaction_queue', []))
+        if not queued:
+            return
+        summary = user_data.get('summary', '')
+        tokens_before = estimate_tokens(summary) + sum(estimate_tokens(str(msg.get('content') or '')) for msg in queued)
+
+        start = time.monotonic()
+        new_summary = (await self.summarize_func(build_summary_prompt(summary, queued))).strip()
+        if not new_summary:
+            raise ValueError(lm.get('error_empty_ai_response'))
+
+        # The conversation may have changed while the summary was generated
+        async with self.lock_func(user_id, channel_id) if self.lock_func else contextlib.nullcontext():
+            user_data = await self.load_func(user_id, channel_id)
+            current = user_data.get('compaction_queue', [])
+            if current[:len(queued)] != queued:
+                logger.info(lm.get('log_compaction_discarded').format(user_id=user_id, channel_id=channel_id))
+                return
+            user_data['compaction_queue'] = current[len(queued):]
+            user_data['summary'] = new_summary[:SUMMARY_MAX_CHARS]
+            await self.save_func(user_id, user_data, channel_id)
+
+        history_tokens = history_window.count(user_data.get('history', []))
+        tokens_after = estimate_tokens(user_data['summary'])
+        logger.info(lm.get('log_history_compacted').format(
+            user_id=user_id,
+            channel_id=channel_id,
+            messages=len(queued),
+            before=tokens_before,
+            after=tokens_after,
+            prompt_before=history_tokens + tokens_before,
+            prompt_after=history_tokens + tokens_after,
+            duration=time.monotonic() - start
+        ))
+
+# Global instance
+history_window = HistoryWindow()
@@ -0,0 +1,72 @@
+import os
+import aiohttp
+from typing import Any, Dict, Optional, Tuple
+from g4f.client import AsyncClient
+from src.log import logger
+from src.locale_manager import locale_manager as lm
+
+# Constants
+POOL_LIMIT = 100            # open connections in total
+POOL_LIMIT_PER_HOST = 10    # open connections to one host
+DNS_TTL = 300               # seconds DNS answers are cached
+KEEPALIVE_TIMEOUT = 30      # seconds an idle connection is kept open
+REQUEST_TIMEOUT = 30        # default total timeout of a request
+
+class HttpClientManager:
+    """Owns the bot's pooled aiohttp session and its g4f clients."""
+
+    def __init__(self):
+        self.limit = int(os.getenv('HTTP_POOL_LIMIT', POOL_LIMIT))
+        self.limit_per_host = int(os.getenv('HTTP_POOL_LIMIT_PER_HOST', POOL_LIMIT_PER_HOST))
+        self.dns_ttl = int(os.getenv('HTTP_DNS_TTL', DNS_TTL))
+        self.keepalive_timeout = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', KEEPALIVE_TIMEOUT))
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._ai_clients: Dict[Tuple[Any, Optional[str]], AsyncClient] = {}
+
+    def session(self) -> aiohttp.ClientSession:
+        """
+        Shared session with keep-alive, DNS caching and per-host connection limits.
+
+        Created on first use, which must happen inside the running event loop.
+
+        Returns:
+            aiohttp ClientSession
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_ttl,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+            )
+            logger.info(lm.get('log_http_pool_created').format(limit=self.limit, limit_per_host=self.limit_per_host))
+        return self._session
+
+    def ai_client(self, provider: Any = None, api_key: Optional[str] = None) -> AsyncClient:
+        """
+        Get the g4f client for a provider, creating it once.
+
+        Args:
+            provider: Provider class or RetryProvider, g4f's default when None
+            api_key: Optional API key for the provider
+
+        Returns:
+            AsyncClient bound to the provider
+        """
+        key = (provider, api_key)
+        client = self._ai_clients.get(key)
+        if client is None:
+            kwargs = {'api_key': api_key} if api_key else {}
+            client = self._ai_clients[key] = AsyncClient(provider=provider, **kwargs)
+        return client
+
+    async def close(self) -> None:
+        """Close the pooled connections."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._ai_clients.clear()
@@ -1,5 +1,27 @@
+import os
+import json
+from typing import Any, Dict, List, Optional, Tuple
 from src.locale_manager import locale_manager as lm
 
+# Templates of the messages search results are sent to the model as
+SEARCH_CONTEXT_KEYS = (
+    'web_search_instruction',
+    'image_search_instruction',
+    'video_search_instruction',
+    'error_no_results',
+    'error_no_content',
+    'error_no_images',
+    'error_no_videos',
+    'error_processing_results',
+    'error_critical_request_processing',
+    'error_try_later_or_change_query',
+    'error_unsupported_request_type',
+    'error_search_failed'
+)
+MIN_PREFIX_LENGTH = 10
+
+_search_context_prefixes: Optional[Tuple[str, ...]] = None
+
 def get_web_search_instruction(result):
     return lm.get('web_search_instruction').format(result=result)
 
@@ -7,4 +29,44 @@ def get_image_search_instruction(result):
     return lm.get('image_search_instruction').format(result=result)
 
 def get_video_search_instruction(result):
-    return lm.get('video_search_instruction').format(result=result)
\ No newline at end of file
+    return lm.get('video_search_instruction').format(result=result)
+
+def get_search_context_prefixes() -> Tuple[str, ...]:
+    """
+    Fixed beginnings of search context messages in every locale,
+    since a conversation may have been stored under another one.
+
+    Returns:
+        Tuple of message prefixes
+    """
+    global _search_context_prefixes
+    if _search_context_prefixes is None:
+        prefixes = set()
+        for filename in os.listdir(lm.locale_dir):
+            if not filename.endswith('.json'):
+                continue
+            with open(os.path.join(lm.locale_dir, filename), 'r', encoding='utf-8') as f:
+                locale_data = json.load(f)
+            for key in SEARCH_CONTEXT_KEYS:
+                prefix = str(locale_data.get(key, '')).split('{')[0]
+                if len(prefix) >= MIN_PREFIX_LENGTH:
+                    prefixes.add(prefix)
+        _search_context_prefixes = tuple(prefixes)
+    return _search_context_prefixes
+
+def strip_search_context(history: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Remove search results that older versions stored in the conversation history.
+
+    Args:
+        history: Conversation history
+
+    Returns:
+        Tuple of (cleaned history, number of removed messages)
+    """
+    prefixes = get_search_context_prefixes()
+    cleaned = [
+        msg for msg in history
+        if msg.get('role') == 'user' or not str(msg.get('content') or '').startswith(prefixes)
+    ]
+    return cleaned, len(history) - len(cleaned)
@@ -1,4 +1,5 @@
 import asyncio
+import contextlib
 import aiohttp
 from bs4 import BeautifulSoup
 from bs4.element import Comment as BS4Comment
@@ -7,6 +8,7 @@ from dataclasses import dataclass
 from duckduckgo_search import DDGS
 from src.log import logger
 from src.locale_manager import locale_manager as lm
+from utils.deadline_utils import Deadline, deadline_stats
 
 # Constants
 MAX_RESULTS = 5
@@ -61,18 +63,19 @@ class SearchResult:
             'error': self.error
         }
 
-async def search_web(query: str, request_type: str = "search") -> List[Dict[str, Any]]:
+async def search_web(query: str, request_type: str = "search", deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
     """
     Search the web using DuckDuckGo.
     
     Args:
         query: Search query
         request_type: Type of search (search, images, videos)
+        deadline: Optional request deadline bounding the search call
     
     Returns:
         List of search results
     """
-    try:
+    def run_search() -> List[Any]:
         ddgs = DDGS()
         if request_type == 'search':
             logger.info(lm.get('search_web_info').format(query=query))
@@ -103,6 +106,16 @@ async def search_web(query: str, request_type: str = "search") -> List[Dict[str,
             )
             return [result['content'] for result in results if result.get('content')]
         return []
+
+    try:
+        # DDGS is blocking, run it off the event loop so the deadline can be enforced
+        return await asyncio.wait_for(
+            asyncio.to_thread(run_search),
+            timeout=deadline.timeout() if deadline else None
+        )
+    except asyncio.TimeoutError:
+        deadline_stats.record('search')
+        return []
     except Exception as e:
         logger.error(lm.get('search_web_error').format(error=e))
         return []
@@ -293,7 +306,9 @@ async def prepare_search_results(
     results: List[Dict[str, Any]],
     user_instruction: str = "",
     get_website_info_func: Callable[[aiohttp.ClientSession, str], Tuple[Optional[str], Optional[str]]] = get_website_info,
-    cancel_on_error: bool = False
+    cancel_on_error: bool = False,
+    deadline: Optional[Deadline] = None,
+    session: Optional[aiohttp.ClientSession] = None
 ) -> List[Dict[str, Any]]:
     """
     Prepare search results by fetching website information.
@@ -303,6 +318,8 @@ async def prepare_search_results(
         user_instruction: Optional user instruction
         get_website_info_func: Function to get website info
         cancel_on_error: Whether to cancel remaining tasks on error
+        deadline: Optional request deadline; pages still loading when it passes are cancelled
+        session: Shared session to fetch pages with, a temporary one is opened when omitted
     
     Returns:
         List of processed search results
@@ -316,7 +333,7 @@ async def prepare_search_results(
 
     valid_results = [result for result in results if result.get('href')]
     
-    async with aiohttp.ClientSession() as session:
+    async with aiohttp.ClientSession() if session is None else contextlib.nullcontext(session) as session:
         tasks = [
             (result, asyncio.create_task(get_website_info_func(session, result.get('href'))))
             for result in valid_results
@@ -329,8 +346,25 @@ async def prepare_search_results(
             )
             for task in pending:
                 task.cancel()
+        elif deadline and tasks:
+            done, pending = await asyncio.wait(
+                [t[1] for t in tasks],
+                timeout=deadline.timeout()
+            )
+            if pending:
+                deadline_stats.record('search_fetch')
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
         
         for result, task in tasks:
+            if task.cancelled():
+                search_results.append(SearchResult(
+                    type="skipped",
+                    url=result.get('href'),
+                    error=lm.get('error_deadline_exceeded')
+                ).to_dict())
+                continue
             try:
                 title, paragraphs = await task
             except Exception as e:
@@ -0,0 +1,45 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Hashable, List
+
+class KeyedLocks:
+    """
+    Async locks per key, e.g. per conversation.
+
+    A lock is created when a key is first locked and dropped as soon as no
+    task holds or waits for it, so idle keys cost no memory. Different keys
+    never wait for each other.
+    """
+
+    def __init__(self):
+        self._locks: Dict[Hashable, List] = {}  # key -> [lock, tasks holding or waiting]
+
+        # Metrics
+        self.acquired = 0
+        self.contended = 0
+
+    @asynccontextmanager
+    async def lock(self, key: Hashable) -> AsyncIterator[None]:
+        """
+        Hold the lock of a key for the duration of an async with block.
+
+        Args:
+            key: Key to serialize on
+        """
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        elif entry[0].locked():
+            self.contended += 1
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                self.acquired += 1
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    def __len__(self) -> int:
+        return len(self._locks)
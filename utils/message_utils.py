@@ -1,7 +1,10 @@
 import re
+import time
 from typing import List, Tuple, Optional, Union
-from discord import Embed, Message, Interaction
+from discord import Embed, Message, Interaction, HTTPException
+from src.log import logger
 from src.locale_manager import locale_manager as lm
+from utils.deadline_utils import Deadline
 
 # Constants
 CHAR_LIMIT = 1900  # Limit for regular messages
@@ -9,14 +12,42 @@ EMBED_CHAR_LIMIT = 4096  # Limit for Embed field
 CODE_BLOCK_PATTERN = r'```([a-zA-Z]*)\n(.*?)```'
 THINKING_PATTERN = re.compile(r'<think>(.*?)</think>', re.DOTALL)
 REASONING_PATTERN = re.compile(r'Started reasoning...(.*?)Done in \d+s\.', re.DOTALL)
+EDIT_INTERVAL = 1.2  # Min seconds between edits of a streamed message (Discord allows ~5 edits per 5s)
+CODE_FENCE_PATTERN = re.compile(r'```([a-zA-Z]*)')
 
-async def send_split_message(self, response: str, message: Union[Message, Interaction]) -> None:
+def extract_thinking(response: str) -> Tuple[Optional[str], str]:
+   """
+   Extract thinking/reasoning content from the response.
+
+   Args:
+       response: Full response text
+
+   Returns:
+       Tuple of (thinking text, remaining response)
+   """
+   think_match = THINKING_PATTERN.search(response) or REASONING_PATTERN.search(response)
+   if think_match:
+       thinking_text = think_match.group(1).strip()
+       response = think_match.re.sub('', response).strip()
+       return thinking_text, response
+   return None, response
+
+async def send_split_message(
+   self,
+   response: str,
+   message: Union[Message, Interaction],
+   deadline: Optional[Deadline] = None
+) -> None:
    """
    Split and send a message that might exceed Discord's character limits.
    
    Args:
        response: The message content to send
        message: Discord message or interaction object
+       deadline: Optional request deadline; remaining parts are dropped once it passes
+
+   Raises:
+       DeadlineExceeded: If the deadline passes before all parts are sent
    """
    if hasattr(message, 'followup'):
        send_method = message.followup.send
@@ -25,6 +56,13 @@ async def send_split_message(self, response: str, message: Union[Message, Intera
    else:
        raise AttributeError(lm.get('message_send_error'))
 
+   if deadline is not None:
+       raw_send_method = send_method
+
+       async def send_method(*args, **kwargs):
+           deadline.check('send')
+           return await raw_send_method(*args, **kwargs)
+
    def split_code_block(lang: str, code_content: str) -> List[str]:
        """
        Split code content into chunks that fit within Discord's character limit.
@@ -52,23 +90,6 @@ async def send_split_message(self, response: str, message: Union[Message, Intera
        
        return [f"```{lang}\n{chunk}```" for chunk in code_chunks]
 
-   def extract_thinking(response: str) -> Tuple[Optional[str], str]:
-       """
-       Extract thinking/reasoning content from the response.
-       
-       Args:
-           response: Full response text
-       
-       Returns:
-           Tuple of (thinking text, remaining response)
-       """
-       think_match = THINKING_PATTERN.search(response) or REASONING_PATTERN.search(response)
-       if think_match:
-           thinking_text = think_match.group(1).strip()
-           response = think_match.re.sub('', response).strip()
-           return thinking_text, response
-       return None, response
-
    async def send_embed_message(thinking_text: str) -> None:
        """
        Send thinking content as an embed message.
@@ -119,3 +140,136 @@ async def send_split_message(self, response: str, message: Union[Message, Intera
            await send_method(msg)
 
    await smart_send(response)
+
+class StreamingMessage:
+   """Shows a streamed response by progressively editing Discord messages."""
+
+   def __init__(self, message: Union[Message, Interaction]):
+       """
+       Args:
+           message: Discord message or interaction object to answer
+       """
+       if hasattr(message, 'followup'):
+           self.send_method = lambda content: message.followup.send(content, wait=True)
+           self.embed_method = message.followup.send
+       elif hasattr(message, 'channel'):
+           self.send_method = message.channel.send
+           self.embed_method = message.channel.send
+       else:
+           raise AttributeError(lm.get('message_send_error'))
+
+       self.messages: List[Message] = []
+       self.current: Optional[Message] = None
+       self.shown = ""
+       self.committed = 0
+       self.reopen_fence = ""
+       self.text = ""
+       self.last_edit = 0.0
+
+   @property
+   def started(self) -> bool:
+       """Whether anything has been posted to Discord yet."""
+       return bool(self.messages)
+
+   async def update(self, text: str) -> None:
+       """
+       Show the response received so far, throttled to EDIT_INTERVAL.
+
+       Text that does not continue what was shown (another provider took over
+       the stream) starts the response over.
+
+       Args:
+           text: Full response text received so far
+       """
+       if not text.startswith(self.text):
+           await self.reset()
+       self.text = text
+       if self.current is not None and time.monotonic() - self.last_edit < EDIT_INTERVAL:
+           return
+       await self._render(final=False)
+
+   async def finish(self, text: str) -> None:
+       """
+       Show the complete response and post the model's thinking, if any.
+
+       A response that does not continue the streamed text, e.g. an error after
+       every provider failed, replaces what was shown.
+
+       Args:
+           text: Complete response text
+       """
+       if not text.startswith(self.text):
+           await self.reset()
+       self.text = text
+       thinking_text, _ = extract_thinking(text)
+       await self._render(final=True)
+       if thinking_text:
+           for chunk in (thinking_text[i:i + EMBED_CHAR_LIMIT] for i in range(0, len(thinking_text), EMBED_CHAR_LIMIT)):
+               await self.embed_method(embed=Embed(title=lm.get('message_ai_thinking'), description=chunk, color=0x3498db))
+
+   async def reset(self) -> None:
+       """Start the response over: the first posted message is reused, the others are deleted."""
+       for message in self.messages[1:]:
+           try:
+               await message.delete()
+           except HTTPException as e:
+               logger.warning(lm.get('log_stream_edit_error').format(error=e))
+       self.messages = self.messages[:1]
+       self.current = self.messages[0] if self.messages else None
+       self.shown = ""
+       self.committed = 0
+       self.reopen_fence = ""
+       self.text = ""
+       self.last_edit = 0.0
+
+   def _visible_text(self, final: bool) -> str:
+       """Response text without thinking blocks; an unfinished block shows a placeholder."""
+       _, visible = extract_thinking(self.text)
+       if not final:
+           for marker in ('<think>', 'Started reasoning...'):
+               start = visible.find(marker)
+               if start != -1:
+                   visible = visible[:start] + lm.get('message_ai_thinking')
+                   break
+       return visible
+
+   async def _render(self, final: bool) -> None:
+       visible = self._visible_text(final)
+
+       # Roll over to a new message once the current one is full
+       while len(self.reopen_fence) + len(visible) - self.committed > CHAR_LIMIT:
+           limit = self.committed + CHAR_LIMIT - len(self.reopen_fence) - 4
+           cut = visible.rfind('\n', self.committed, limit)
+           if cut <= self.committed:
+               cut = limit
+           chunk = self.reopen_fence + visible[self.committed:cut]
+           fences = CODE_FENCE_PATTERN.findall(chunk)
+           next_fence = ""
+           if len(fences) % 2 == 1:
+               chunk += "\n```"
+               next_fence = f"```{fences[-1]}\n"
+           await self._show(chunk)
+           self.current = None
+           self.shown = ""
+           self.reopen_fence = next_fence
+           self.committed = cut + 1 if visible[cut:cut + 1] == '\n' else cut
+
+       tail = self.reopen_fence + visible[self.committed:]
+       if not final and len(CODE_FENCE_PATTERN.findall(tail)) % 2 == 1:
+           tail += "\n```"
+       if tail.strip():
+           await self._show(tail)
+
+   async def _show(self, content: str) -> None:
+       if content == self.shown:
+           return
+       try:
+           if self.current is None:
+               self.current = await self.send_method(content)
+               self.messages.append(self.current)
+           else:
+               await self.current.edit(content=content)
+           self.shown = content
+           self.last_edit = time.monotonic()
+       except HTTPException as e:
+           logger.warning(lm.get('log_stream_edit_error').format(error=e))
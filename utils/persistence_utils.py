@@ -0,0 +1,145 @@
+import os
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+from src.log import logger
+from src.locale_manager import locale_manager as lm
+
+# Constants
+WRITE_DELAY = 2.0       # seconds changes are collected before a conversation is written
+WRITE_CONCURRENCY = 4   # conversations written at the same time
+MAX_RETRIES = 5         # failed writes of a key before its change is dropped
+
+class WriteBehindStore:
+    """
+    Collects changed objects in memory and writes each at most once per delay window.
+
+    Reads must check get() first, since the newest version of a dirty object
+    exists only here until it is flushed. A failed write is retried with an
+    exponentially growing delay and dropped after MAX_RETRIES attempts.
+    """
+
+    def __init__(
+        self,
+        write_func: Callable[[Hashable, Any], Awaitable[bool]],
+        delay: Optional[float] = None,
+        concurrency: Optional[int] = None
+    ):
+        """
+        Args:
+            write_func: Writes one object, returns True on success
+            delay: Debounce window in seconds, WRITE_BEHIND_DELAY env when omitted
+            concurrency: Max parallel writes, WRITE_BEHIND_CONCURRENCY env when omitted
+        """
+        self.write_func = write_func
+        self.delay = delay if delay is not None else float(os.getenv('WRITE_BEHIND_DELAY', WRITE_DELAY))
+        self.semaphore = asyncio.Semaphore(concurrency or int(os.getenv('WRITE_BEHIND_CONCURRENCY', WRITE_CONCURRENCY)))
+        self.dirty: Dict[Hashable, Any] = {}
+        self.scheduled: Dict[Hashable, asyncio.Task] = {}
+        self.inflight: Dict[Hashable, Any] = {}  # values being written, still visible to get()
+        self.attempts: Dict[Hashable, int] = {}  # consecutive failed writes per key
+
+        # Metrics
+        self.marked = 0
+        self.writes = 0
+        self.failures = 0
+        self.dropped = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Pending or in-flight value of a key, None if everything is written."""
+        value = self.dirty.get(key)
+        return value if value is not None else self.inflight.get(key)
+
+    def mark_dirty(self, key: Hashable, value: Any) -> None:
+        """
+        Remember the newest value of a key and schedule its write.
+
+        Args:
+            key: Identity of the stored object, e.g. its file path
+            value: Value to write
+        """
+        self.marked += 1
+        self._schedule(key, value, self.delay)
+
+    def _schedule(self, key: Hashable, value: Any, delay: float) -> None:
+        self.dirty[key] = value
+        if key not in self.scheduled:
+            self.scheduled[key] = asyncio.create_task(self._flush_later(key, delay))
+
+    async def _flush_later(self, key: Hashable, delay: float) -> None:
+        await asyncio.sleep(delay)
+        self.scheduled.pop(key, None)
+        await self.flush(key)
+
+    async def flush(self, key: Hashable) -> None:
+        """Write a key's pending value now."""
+        if key in self.inflight:
+            # A write of this key is in progress, write the newer value after it
+            if key in self.dirty and key not in self.scheduled:
+                self.scheduled[key] = asyncio.create_task(self._flush_later(key, self.delay))
+            return
+        value = self.dirty.pop(key, None)
+        if value is None:
+            return
+
+        self.inflight[key] = value
+        try:
+            async with self.semaphore:
+                try:
+                    success = await self.write_func(key, value)
+                except Exception as e:
+                    logger.error(lm.get('log_write_behind_error').format(key=key, error=e))
+                    success = False
+        finally:
+            self.inflight.pop(key, None)
+
+        if success:
+            self.writes += 1
+            self.attempts.pop(key, None)
+            return
+
+        self.failures += 1
+        attempts = self.attempts[key] = self.attempts.get(key, 0) + 1
+        if attempts >= MAX_RETRIES:
+            self.attempts.pop(key, None)
+            if key not in self.dirty:
+                self.dropped += 1
+                logger.error(lm.get('log_write_behind_dropped').format(key=key, attempts=attempts))
+                return
+        # Retry with backoff unless a newer value is already waiting
+        if key not in self.dirty:
+            self._schedule(key, value, self.delay * 2 ** attempts)
+
+    async def flush_all(self, timeout: Optional[float] = None) -> None:
+        """
+        Write everything pending, e.g. on shutdown.
+
+        Args:
+            timeout: Seconds to wait for in-flight and pending writes, no limit when omitted
+        """
+        for task in self.scheduled.values():
+            task.cancel()
+        self.scheduled.clear()
+        pending = len(self.dirty)
+
+        async def write_pending() -> None:
+            while self.inflight:
+                await asyncio.sleep(0.05)
+            await asyncio.gather(*(self.flush(key) for key in list(self.dirty)))
+
+        try:
+            await asyncio.wait_for(write_pending(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error(lm.get('log_write_behind_flush_timeout').format(
+                timeout=timeout,
+                count=len(set(self.dirty) | set(self.inflight))
+            ))
+        # Writes that failed were queued again; on shutdown there is no next window
+        for task in self.scheduled.values():
+            task.cancel()
+        self.scheduled.clear()
+        logger.info(lm.get('log_write_behind_flushed').format(
+            count=pending,
+            failed=len(self.dirty),
+            marked=self.marked,
+            writes=self.writes
+        ))
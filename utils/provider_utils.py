@@ -0,0 +1,803 @@
+import os
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager, suppress
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from src.log import logger
+from src.locale_manager import locale_manager as lm
+from utils.files_utils import write_json
+
+# Constants
+EWMA_ALPHA = 0.3            # weight of the newest latency sample
+LATENCY_WINDOW = 50         # latency samples kept for percentiles
+OUTCOME_WINDOW = 20         # recent outcomes kept for success ratio
+PRIOR_LATENCY = 10.0        # expected latency (seconds) of a provider we know nothing about
+FAILURE_PENALTY = 60.0      # cost (seconds) of a failed attempt when ranking providers
+MIN_SUCCESS_RATIO = 0.05    # floor for success ratio to keep scores finite
+HEDGE_MIN_SAMPLES = 5       # latency samples needed before the hedge delay follows history
+HEDGE_FALLBACK_DELAY = 20.0 # hedge delay (seconds) for providers without enough history
+HEDGE_MIN_DELAY = 1.0       # never hedge earlier than this
+BREAKER_FAILURE_THRESHOLD = 3       # consecutive failures that open the circuit
+BREAKER_COOLDOWN = 300.0            # first cooldown (seconds) of an open circuit
+BREAKER_MAX_COOLDOWN = 6 * 60 * 60  # cooldown grows up to this while probes keep failing
+BREAKER_TRIP_ERRORS = {'rate_limit', 'forbidden', 'cloudflare'}  # open the circuit immediately
+
+BULKHEAD_LIMIT = 4                  # default concurrent requests per provider class
+BULKHEAD_MAX_WAIT = 10.0            # default max queue wait (seconds) before failing over
+PROBE_INTERVAL = 600.0              # seconds between probes of a healthy (model, provider) pair
+PROBE_MAX_INTERVAL = 6 * 60 * 60    # failing pairs back off up to this interval
+PROBE_JITTER = 0.2                  # +/- share of the interval added as random jitter
+PROBE_CONCURRENCY = 2               # probes running at the same time
+PROBE_TIMEOUT = 60.0                # seconds before a probe counts as failed
+PROBE_MESSAGES = [{"role": "user", "content": "Hi! Reply with one word."}]
+SNAPSHOT_HALF_LIFE = 6 * 60 * 60    # age (seconds) at which a persisted snapshot counts half
+SNAPSHOT_MAX_AGE = 7 * 24 * 60 * 60 # older snapshot entries are ignored
+
+
+# Models tried, best-ranked first, when every provider of a model failed
+DEFAULT_MODEL_FALLBACKS = {
+    'gpt-4.1': ['gpt-4o', 'gpt-4.1-mini', 'llama-3.3-70b'],
+    'gpt-4o': ['gpt-4.1', 'gpt-4o-mini', 'llama-3.3-70b'],
+    'gpt-4.1-mini': ['gpt-4o-mini', 'gpt-4.1-nano'],
+    'gpt-4o-mini': ['gpt-4.1-mini', 'gpt-4.1-nano'],
+    'o3-mini': ['o4-mini', 'deepseek-r1'],
+    'o4-mini': ['o3-mini', 'deepseek-r1'],
+    'deepseek-r1': ['qwq-32b', 'deepseek-r1-distill-llama-70b'],
+    'deepseek-v3': ['gpt-4o', 'llama-3.3-70b'],
+    'claude-3.7-sonnet': ['claude-3.5-sonnet', 'gpt-4.1'],
+    'gemini-2.0-flash': ['gemini-1.5-flash', 'gpt-4o-mini'],
+}
+
+# Circuit breaker states
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half-open'
+
+class ProviderBusyError(Exception):
+    """Raised when a provider's concurrency limit is reached and queueing would take too long."""
+    pass
+
+class CircuitOpenError(ProviderBusyError):
+    """Raised when a provider's circuit breaker does not let a request through."""
+    pass
+
+def get_provider_name(provider: Any) -> str:
+    """Return a stable name for a provider class."""
+    return getattr(provider, '__name__', str(provider))
+
+def classify_error(error: BaseException) -> str:
+    """
+    Map a provider exception to a coarse error class.
+
+    Args:
+        error: Exception raised by the provider
+
+    Returns:
+        One of: timeout, rate_limit, forbidden, cloudflare, auth, not_found, server, other
+    """
+    if isinstance(error, asyncio.TimeoutError):
+        return 'timeout'
+
+    text = f"{type(error).__name__} {error}".lower()
+    if 'cloudflare' in text or 'cf-ray' in text or 'just a moment' in text:
+        return 'cloudflare'
+    if '429' in text or 'rate limit' in text or 'ratelimit' in text or 'too many requests' in text:
+        return 'rate_limit'
+    if '403' in text or 'forbidden' in text:
+        return 'forbidden'
+    if '401' in text or 'auth' in text or 'api_key' in text:
+        return 'auth'
+    if '404' in text or 'not found' in text:
+        return 'not_found'
+    if any(code in text for code in ('500', '502', '503', '504')):
+        return 'server'
+    if 'timeout' in text or 'timed out' in text:
+        return 'timeout'
+    return 'other'
+
+@dataclass
+class ProviderStats:
+    """Rolling performance statistics for one (model, provider) pair."""
+    ewma_latency: Optional[float] = None
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=LATENCY_WINDOW))
+    first_token_latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=LATENCY_WINDOW))
+    outcomes: Deque[bool] = field(default_factory=lambda: deque(maxlen=OUTCOME_WINDOW))
+    last_error: Optional[str] = None
+    last_error_class: Optional[str] = None
+    last_used: Optional[float] = None
+
+    def record_success(self, latency: float, first_token: Optional[float] = None) -> None:
+        """Record a successful response, its latency and (when streamed) time to first token in seconds."""
+        if self.ewma_latency is None:
+            self.ewma_latency = latency
+        else:
+            self.ewma_latency = EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.ewma_latency
+        self.latencies.append(latency)
+        if first_token is not None:
+            self.first_token_latencies.append(first_token)
+        self.outcomes.append(True)
+        self.last_used = time.time()
+
+    def record_probe_success(self) -> None:
+        """Record a successful health probe; its latency says nothing about real completions."""
+        self.outcomes.append(True)
+
+    def record_failure(self, error: BaseException) -> None:
+        """Record a failed attempt."""
+        self.outcomes.append(False)
+        self.last_error = str(error)
+        self.last_error_class = classify_error(error)
+        self.last_used = time.time()
+
+    @property
+    def success_ratio(self) -> float:
+        """Share of successful attempts in the recent window (1.0 when unknown)."""
+        if not self.outcomes:
+            return 1.0
+        return sum(self.outcomes) / len(self.outcomes)
+
+    def percentile(self, q: float, first_token: bool = False) -> Optional[float]:
+        """
+        Latency percentile over the recent window.
+
+        Args:
+            q: Percentile in range 0..1
+            first_token: Use time to first token instead of full response latency
+
+        Returns:
+            Latency in seconds or None if there are no samples yet
+        """
+        samples = self.first_token_latencies if first_token else self.latencies
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+        return ordered[index]
+
+    @property
+    def p95(self) -> Optional[float]:
+        return self.percentile(0.95)
+
+    def expected_latency(self) -> float:
+        """Expected time to get an answer from this provider, failures included."""
+        latency = self.ewma_latency if self.ewma_latency is not None else PRIOR_LATENCY
+        success = max(self.success_ratio, MIN_SUCCESS_RATIO)
+        return success * latency + (1 - success) * FAILURE_PENALTY
+
+    @classmethod
+    def from_snapshot(cls, data: Dict[str, Any], weight: float) -> 'ProviderStats':
+        """
+        Rebuild statistics from a persisted snapshot entry, decayed toward neutral priors.
+
+        Args:
+            data: Snapshot entry, see ProviderScoreboard.to_snapshot
+            weight: Trust in the snapshot, 1.0 for fresh and close to 0.0 for stale data
+
+        Returns:
+            ProviderStats with approximate latency samples and outcomes
+        """
+        stats = cls()
+        samples = round(min(data.get('samples') or 0, OUTCOME_WINDOW) * weight)
+        response_time = data.get('response_time')
+        success_ratio = data.get('success_ratio', 0.0 if data.get('error') else 1.0)
+
+        if response_time is not None:
+            stats.ewma_latency = weight * response_time + (1 - weight) * PRIOR_LATENCY
+            stats.latencies.extend([stats.ewma_latency] * max(samples - 1, 0))
+            if data.get('p95') is not None and samples:
+                stats.latencies.append(weight * data['p95'] + (1 - weight) * PRIOR_LATENCY)
+
+        successes = round(success_ratio * samples)
+        stats.outcomes.extend([True] * successes + [False] * (samples - successes))
+        stats.last_error = data.get('error')
+        return stats
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert ProviderStats instance to a dictionary."""
+        return {
+            'ewma_latency': self.ewma_latency,
+            'p95': self.p95,
+            'success_ratio': self.success_ratio,
+            'samples': len(self.outcomes),
+            'last_error': self.last_error,
+            'last_error_class': self.last_error_class
+        }
+
+class ProviderScoreboard:
+    """Tracks latency and success per (model, provider) and ranks providers by expected latency."""
+
+    def __init__(self):
+        self.stats: Dict[Tuple[str, str], ProviderStats] = {}
+
+    def get(self, model: str, provider: Any) -> ProviderStats:
+        """Get (or create) statistics for a model/provider pair."""
+        key = (model, get_provider_name(provider))
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = ProviderStats()
+        return stats
+
+    def record_success(
+        self,
+        model: str,
+        provider: Any,
+        latency: float,
+        first_token: Optional[float] = None,
+        probe: bool = False
+    ) -> ProviderStats:
+        stats = self.get(model, provider)
+        if probe:
+            stats.record_probe_success()
+        else:
+            stats.record_success(latency, first_token)
+        return stats
+
+    def record_failure(self, model: str, provider: Any, error: BaseException) -> ProviderStats:
+        stats = self.get(model, provider)
+        stats.record_failure(error)
+        return stats
+
+    def hedge_delay(self, model: str, provider: Any, q: float, first_token: bool = False) -> float:
+        """
+        Time to wait for a provider before firing a hedged request at the next one.
+
+        Args:
+            model: Model name
+            provider: Provider currently being waited on
+            q: Latency percentile (0..1) after which the request is considered slow
+            first_token: The request is streamed, so wait for the first token only
+
+        Returns:
+            Delay in seconds
+        """
+        stats = self.get(model, provider)
+        samples = stats.first_token_latencies if first_token else stats.latencies
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_FALLBACK_DELAY
+        return max(HEDGE_MIN_DELAY, stats.percentile(q, first_token))
+
+    def to_snapshot(self) -> List[Dict[str, Any]]:
+        """
+        Export statistics in the shape tests.py writes to results.json.
+
+        Returns:
+            List of {model, provider, response_time | error, ...} entries
+        """
+        snapshot = []
+        for (model, provider), stats in self.stats.items():
+            if not stats.outcomes:
+                continue
+            entry = {
+                'model': model,
+                'provider': provider,
+                'response_time': stats.ewma_latency,
+                'p95': stats.p95,
+                'success_ratio': stats.success_ratio,
+                'samples': len(stats.outcomes),
+                'updated_at': datetime.fromtimestamp(stats.last_used or time.time()).isoformat()
+            }
+            if not stats.outcomes[-1] and stats.last_error:
+                entry['error'] = stats.last_error
+            snapshot.append(entry)
+        return snapshot
+
+    def load_snapshot(self, snapshot: List[Dict[str, Any]]) -> int:
+        """
+        Seed statistics from a persisted snapshot; older entries weigh less.
+
+        Args:
+            snapshot: Entries produced by to_snapshot (or results.json from tests.py)
+
+        Returns:
+            Number of entries loaded
+        """
+        now = datetime.now()
+        loaded = 0
+        for data in snapshot:
+            try:
+                updated_at = datetime.fromisoformat(data['updated_at']) if data.get('updated_at') else now
+                age = (now - updated_at).total_seconds()
+                if age > SNAPSHOT_MAX_AGE:
+                    continue
+                weight = 0.5 ** (max(age, 0) / SNAPSHOT_HALF_LIFE)
+                data.setdefault('samples', 1)
+                self.stats[(data['model'], data['provider'])] = ProviderStats.from_snapshot(data, weight)
+                loaded += 1
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(lm.get('log_provider_snapshot_entry_error').format(error=e))
+        return loaded
+
+    def order(self, model: str, providers: List[Any]) -> List[Any]:
+        """
+        Order providers by expected latency, best first.
+
+        Providers with equal scores keep their configured order, so unseen
+        providers are tried in the order they are listed in providers_dict.
+
+        Args:
+            model: Model name
+            providers: Configured providers for the model
+
+        Returns:
+            New list of providers, best candidate first
+        """
+        return sorted(providers, key=lambda provider: self.get(model, provider).expected_latency())
+
+class HedgeLimiter:
+    """Caps the number of extra (hedged) in-flight requests per model."""
+
+    def __init__(self):
+        self.in_flight: Dict[str, int] = {}
+
+    def try_acquire(self, model: str, limit: int) -> bool:
+        """Take a hedge slot for the model if one is free."""
+        if self.in_flight.get(model, 0) >= limit:
+            return False
+        self.in_flight[model] = self.in_flight.get(model, 0) + 1
+        return True
+
+    def release(self, model: str) -> None:
+        """Return a hedge slot taken with try_acquire."""
+        count = self.in_flight.get(model, 0) - 1
+        if count > 0:
+            self.in_flight[model] = count
+        else:
+            self.in_flight.pop(model, None)
+
+@dataclass
+class CircuitBreaker:
+    """Closed/open/half-open circuit breaker for one provider class."""
+    name: str
+    state: str = CIRCUIT_CLOSED
+    failures: int = 0
+    cooldown: float = BREAKER_COOLDOWN
+    opened_at: Optional[float] = None
+    probe_in_flight: bool = False
+
+    def retry_in(self) -> float:
+        """Seconds left until an open circuit lets a probe through."""
+        if self.state != CIRCUIT_OPEN or self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.cooldown - time.monotonic())
+
+    def available(self) -> bool:
+        """Whether allow_request would let a request through, without changing the state."""
+        if self.state == CIRCUIT_HALF_OPEN:
+            return not self.probe_in_flight
+        return self.retry_in() <= 0
+
+    def allow_request(self) -> bool:
+        """
+        Check whether a request may be sent to the provider.
+
+        An open circuit lets a single probe through once the cooldown is over;
+        the circuit stays half-open until that probe finishes.
+        """
+        if self.state == CIRCUIT_CLOSED:
+            return True
+        if self.state == CIRCUIT_OPEN and self.retry_in() <= 0:
+            self.state = CIRCUIT_HALF_OPEN
+            logger.info(lm.get('log_circuit_half_open').format(provider=self.name))
+        if self.state == CIRCUIT_HALF_OPEN and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self.state != CIRCUIT_CLOSED:
+            logger.info(lm.get('log_circuit_closed').format(provider=self.name))
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self.cooldown = BREAKER_COOLDOWN
+        self.opened_at = None
+        self.probe_in_flight = False
+
+    def record_failure(self, error_class: str) -> None:
+        self.failures += 1
+        if self.state == CIRCUIT_HALF_OPEN:
+            # The probe failed: stay away for longer
+            self.cooldown = min(self.cooldown * 2, BREAKER_MAX_COOLDOWN)
+            self._open(error_class)
+        elif self.state == CIRCUIT_CLOSED and (
+            self.failures >= BREAKER_FAILURE_THRESHOLD or error_class in BREAKER_TRIP_ERRORS
+        ):
+            self._open(error_class)
+
+    def release(self) -> None:
+        """Give up a probe slot without an outcome (e.g. the request was cancelled)."""
+        self.probe_in_flight = False
+
+    def _open(self, error_class: str) -> None:
+        self.state = CIRCUIT_OPEN
+        self.opened_at = time.monotonic()
+        self.probe_in_flight = False
+        logger.warning(lm.get('log_circuit_open').format(
+            provider=self.name,
+            failures=self.failures,
+            error_class=error_class,
+            cooldown=self.cooldown
+        ))
+
+class ProviderBreakers:
+    """Registry of circuit breakers, one per provider class, kept for the process lifetime."""
+
+    def __init__(self):
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, provider: Any) -> CircuitBreaker:
+        name = get_provider_name(provider)
+        breaker = self.breakers.get(name)
+        if breaker is None:
+            breaker = self.breakers[name] = CircuitBreaker(name)
+        return breaker
+
+    def allow_request(self, provider: Any) -> bool:
+        return self.get(provider).allow_request()
+
+    def available(self, provider: Any) -> bool:
+        return self.get(provider).available()
+
+    def record_success(self, provider: Any) -> None:
+        self.get(provider).record_success()
+
+    def record_failure(self, provider: Any, error: BaseException) -> None:
+        self.get(provider).record_failure(classify_error(error))
+
+    def release(self, provider: Any) -> None:
+        self.get(provider).release()
+
+class ProviderBulkhead:
+    """Bounded concurrency and wait queue for one provider class."""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit)
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    def estimated_wait(self, service_time: float) -> float:
+        """Rough time until a new request gets a slot, given the provider's usual latency."""
+        if self.active < self.limit:
+            return 0.0
+        return math.ceil((self.waiting + 1) / self.limit) * service_time
+
+    @asynccontextmanager
+    async def slot(self, max_wait: float, service_time: float) -> AsyncIterator[float]:
+        """
+        Hold one of the provider's concurrency slots.
+
+        Args:
+            max_wait: Max seconds to wait in the queue
+            service_time: Expected latency of one request, used to reject hopeless waits early
+
+        Yields:
+            Time spent waiting in the queue, in seconds
+
+        Raises:
+            ProviderBusyError: If the slot cannot be acquired within max_wait
+        """
+        if self.estimated_wait(service_time) > max_wait:
+            self.rejected += 1
+            raise ProviderBusyError(lm.get('error_provider_busy').format(provider=self.name))
+
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), timeout=max_wait)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise ProviderBusyError(lm.get('error_provider_busy').format(provider=self.name))
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        try:
+            yield time.monotonic() - start
+        finally:
+            self.active -= 1
+            self.semaphore.release()
+
+class ProviderBulkheads:
+    """Registry of bulkheads, one per provider class."""
+
+    def __init__(self):
+        self.limit = int(os.getenv('PROVIDER_CONCURRENCY', BULKHEAD_LIMIT))
+        self.bulkheads: Dict[str, ProviderBulkhead] = {}
+
+    def get(self, provider: Any) -> ProviderBulkhead:
+        name = get_provider_name(provider)
+        bulkhead = self.bulkheads.get(name)
+        if bulkhead is None:
+            bulkhead = self.bulkheads[name] = ProviderBulkhead(name, self.limit)
+        return bulkhead
+
+def request_key(model: str, messages: List[Dict[str, str]]) -> str:
+    """
+    Hash a (model, messages) payload so identical requests share a key.
+
+    Args:
+        model: Model name
+        messages: Conversation sent to the provider
+
+    Returns:
+        Hex digest of the normalized conversation
+    """
+    normalized = [model] + [
+        [message.get('role'), (message.get('content') or '').strip()]
+        for message in messages
+    ]
+    payload = json.dumps(normalized, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class RequestCoalescer:
+    """Shares one provider call between identical requests that are in flight at the same time."""
+
+    def __init__(self):
+        self.in_flight: Dict[str, asyncio.Task] = {}
+        self.waiters: Dict[str, int] = {}
+        self.listeners: Dict[str, Dict[object, Callable[[str], Awaitable[None]]]] = {}  # key -> delta callbacks of waiting callers
+        self.coalesced = 0
+
+    async def run(
+        self,
+        key: str,
+        factory: Callable[[Optional[Callable[[str], Awaitable[None]]]], Awaitable[Any]],
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> Any:
+        """
+        Run factory() once per key and fan its result out to every caller.
+
+        Streamed deltas go only to callers that are still waiting, so a caller
+        that timed out or was cancelled stops receiving them. The shared call
+        streams if the caller that started it does, and it is cancelled only
+        when every caller waiting on it is cancelled.
+
+        Args:
+            key: Request key, see request_key
+            factory: Creates the coroutine doing the actual call from a delta callback (None when not streaming)
+            on_delta: This caller's delta callback
+
+        Returns:
+            Result of the shared call
+        """
+        task = self.in_flight.get(key)
+        if task is None:
+            listeners = self.listeners[key] = {}
+
+            async def fan_out(text: str) -> None:
+                for callback in list(listeners.values()):
+                    await callback(text)
+
+            task = asyncio.create_task(factory(fan_out if on_delta is not None else None))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self._forget(key, task))
+        else:
+            listeners = self.listeners[key]
+            self.coalesced += 1
+            logger.info(lm.get('log_request_coalesced').format(key=key[:12], waiters=self.waiters.get(key, 0) + 1))
+
+        token = object()
+        if on_delta is not None:
+            listeners[token] = on_delta
+        self.waiters[key] = self.waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self.waiters.get(key, 0) <= 1:
+                task.cancel()
+            raise
+        finally:
+            listeners.pop(token, None)
+            self.waiters[key] = self.waiters.get(key, 1) - 1
+            if self.waiters[key] <= 0:
+                self.waiters.pop(key, None)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self.in_flight.get(key) is task:
+            del self.in_flight[key]
+            del self.listeners[key]
+
+class ProviderHealthProber:
+    """
+    Periodically sends tiny probe requests to every (model, provider) pair to keep routing stats fresh.
+
+    Probes only feed the success ratio and circuit breakers: a tiny prompt answers
+    much faster than a real completion, so its latency must not skew ranking or hedge delays.
+    """
+
+    def __init__(
+        self,
+        probe_func: Callable[[str, Any], Awaitable[Any]],
+        interval: float = PROBE_INTERVAL,
+        concurrency: int = PROBE_CONCURRENCY
+    ):
+        """
+        Args:
+            probe_func: Coroutine function sending one probe request (model, provider);
+                it is expected to take the breaker slot and record its own outcome
+                in the scoreboard and breakers, raising CircuitOpenError if the breaker refuses
+            interval: Seconds between probes of a healthy pair
+            concurrency: Max probes running at the same time
+        """
+        self.probe_func = probe_func
+        self.interval = interval
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.next_probe: Dict[Tuple[str, str], float] = {}
+        self.failures: Dict[Tuple[str, str], int] = {}
+
+    def _jitter(self, delay: float) -> float:
+        return delay * (1 + random.uniform(-PROBE_JITTER, PROBE_JITTER))
+
+    def _next_interval(self, key: Tuple[str, str]) -> float:
+        """Healthy pairs are probed every interval, failing ones back off exponentially."""
+        failures = self.failures.get(key, 0)
+        return self._jitter(min(self.interval * (2 ** failures), PROBE_MAX_INTERVAL))
+
+    def due_pairs(self, providers_dict: Dict[str, List[Any]]) -> List[Tuple[str, Any]]:
+        """
+        Collect (model, provider) pairs whose probe is due.
+
+        Pairs that served real traffic recently are rescheduled instead of probed,
+        and pairs behind an open circuit wait until the breaker lets a probe through.
+        """
+        now = time.monotonic()
+        due = []
+        for model, providers in providers_dict.items():
+            for provider in providers:
+                key = (model, get_provider_name(provider))
+                if key not in self.next_probe:
+                    # Spread the first round over the whole interval
+                    self.next_probe[key] = now + random.uniform(0, self.interval)
+                    continue
+                if self.next_probe[key] > now:
+                    continue
+
+                stats = provider_scoreboard.get(model, provider)
+                if stats.last_used is not None:
+                    idle = time.time() - stats.last_used
+                    if idle < self.interval and stats.outcomes and stats.outcomes[-1]:
+                        self.next_probe[key] = now + self._jitter(self.interval - idle)
+                        continue
+
+                breaker = provider_breakers.get(provider)
+                if breaker.state == CIRCUIT_OPEN and breaker.retry_in() > 0:
+                    self.next_probe[key] = now + breaker.retry_in()
+                    continue
+
+                due.append((model, provider))
+        return due
+
+    async def probe(self, model: str, provider: Any) -> bool:
+        """Send one probe and schedule the next one; returns True on success."""
+        key = (model, get_provider_name(provider))
+        async with self.semaphore:
+            task = asyncio.create_task(self.probe_func(model, provider))
+            done, _ = await asyncio.wait({task}, timeout=PROBE_TIMEOUT)
+            try:
+                if not done:
+                    # Cancelled by our timeout, so probe_func never recorded an outcome
+                    task.cancel()
+                    with suppress(asyncio.CancelledError):
+                        await task
+                    raise asyncio.TimeoutError()
+                task.result()
+                ok = True
+            except CircuitOpenError:
+                self.next_probe[key] = time.monotonic() + self._next_interval(key)
+                return False
+            except ProviderBusyError:
+                # Busy with real traffic, which keeps the stats fresh anyway
+                self.next_probe[key] = time.monotonic() + self._jitter(self.interval)
+                return True
+            except asyncio.TimeoutError as e:
+                # A provider's own timeout was already recorded by probe_func
+                if not done:
+                    provider_breakers.record_failure(provider, e)
+                    provider_scoreboard.record_failure(model, provider, e)
+                ok = False
+            except Exception:
+                ok = False
+
+        self.failures[key] = 0 if ok else self.failures.get(key, 0) + 1
+        self.next_probe[key] = time.monotonic() + self._next_interval(key)
+        return ok
+
+    async def run_once(self, providers_dict: Dict[str, List[Any]]) -> None:
+        """Probe every pair that is due, with bounded concurrency."""
+        due = self.due_pairs(providers_dict)
+        if not due:
+            return
+        results = await asyncio.gather(*(self.probe(model, provider) for model, provider in due))
+        logger.info(lm.get('log_probe_cycle').format(total=len(results), ok=sum(results), failed=len(results) - sum(results)))
+
+def parse_fallback_chains(value: str) -> Dict[str, List[str]]:
+    """
+    Parse fallback chains like "gpt-4.1>gpt-4o>llama-3.3-70b;o3-mini>o4-mini".
+
+    Each chain sets the fallbacks of its first model.
+
+    Args:
+        value: Raw MODEL_FALLBACK_CHAINS value
+
+    Returns:
+        Dict of model name to its fallback models
+    """
+    chains = {}
+    for chain in value.split(';'):
+        models = [model.strip() for model in chain.split('>') if model.strip()]
+        if len(models) > 1:
+            chains[models[0]] = models[1:]
+    return chains
+
+def rank_fallback_models(models: List[str], providers_dict: Dict[str, List[Any]]) -> List[str]:
+    """
+    Order fallback models by live health: models with a provider whose circuit
+    is not open come first, then by the best expected latency of those providers.
+
+    Models with equal scores keep their configured order; models without
+    providers are left out.
+
+    Args:
+        models: Configured fallback models
+        providers_dict: model_name -> [ProviderClass, ...]
+
+    Returns:
+        New list of models, best candidate first
+    """
+    def score(model: str) -> Tuple[bool, float]:
+        available = [provider for provider in providers_dict[model] if provider_breakers.available(provider)]
+        if not available:
+            return True, math.inf
+        return False, min(provider_scoreboard.get(model, provider).expected_latency() for provider in available)
+
+    return sorted((model for model in models if providers_dict.get(model)), key=score)
+
+def load_provider_snapshot(filepath: str) -> int:
+    """
+    Load a persisted provider snapshot into the global scoreboard.
+
+    Called synchronously during provider initialization.
+
+    Args:
+        filepath: Path to the snapshot file
+
+    Returns:
+        Number of entries loaded
+    """
+    if not os.path.exists(filepath):
+        return 0
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.error(lm.get('file_json_read_error').format(filepath=filepath, error=e))
+        return 0
+    return provider_scoreboard.load_snapshot(snapshot)
+
+async def save_provider_snapshot(filepath: str) -> bool:
+    """
+    Persist the global scoreboard.
+
+    Args:
+        filepath: Path to the snapshot file
+
+    Returns:
+        True if successful, False otherwise
+    """
+    return await write_json(filepath, provider_scoreboard.to_snapshot())
+
+# Global instances
+provider_scoreboard = ProviderScoreboard()
+hedge_limiter = HedgeLimiter()
+provider_breakers = ProviderBreakers()
+provider_bulkheads = ProviderBulkheads()
+request_coalescer = RequestCoalescer()
@@ -0,0 +1,196 @@
+import os
+import time
+import discord
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+from src.log import logger
+from src.locale_manager import locale_manager as lm
+
+# Constants
+MAX_BUCKETS = 10000  # idle full buckets are dropped above this
+
+# Default limits as (capacity, seconds to refill it completely)
+DEFAULT_LIMITS = {
+    'user': (40, 600),
+    'guild': (200, 600),
+    'ask': (20, 600),
+    'mention': (20, 600),
+    'search': (12, 600),
+    'draw': (16, 600),
+}
+
+# Token costs of requests
+CHAT_COST = 1
+FILE_COST = 1           # extra for a document or image attached to /ask
+SEARCH_COSTS = {'search': 3, 'images': 2, 'videos': 2}
+DRAW_IMAGE_COST = 2     # per generated image
+
+@dataclass
+class TokenBucket:
+    """Token bucket refilled continuously up to its capacity."""
+    capacity: float
+    refill_rate: float  # tokens per second
+    tokens: float = field(default=-1.0)
+    updated_at: float = field(default_factory=time.monotonic)
+
+    def __post_init__(self):
+        if self.tokens < 0:
+            self.tokens = self.capacity
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_rate)
+        self.updated_at = now
+
+    def retry_after(self, cost: float) -> float:
+        """Seconds until `cost` tokens are available, 0 if they are now."""
+        self.refill()
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.refill_rate
+
+    def consume(self, cost: float) -> None:
+        self.tokens -= cost
+
+    @property
+    def full(self) -> bool:
+        self.refill()
+        return self.tokens >= self.capacity
+
+def parse_limit(value: str, default: Tuple[int, int]) -> Tuple[int, int]:
+    """
+    Parse a "capacity/seconds" limit.
+
+    Args:
+        value: Raw env value, e.g. "20/600"
+        default: Limit used when the value is empty or invalid
+
+    Returns:
+        Tuple of (capacity, seconds)
+    """
+    try:
+        capacity, seconds = value.split('/')
+        return int(capacity), int(seconds)
+    except (AttributeError, ValueError):
+        return default
+
+def request_cost(command: str, request_type: Optional[str] = None, count: int = 1, has_file: bool = False) -> int:
+    """
+    Token cost of a request.
+
+    Args:
+        command: Command bucket name (ask, mention, draw)
+        request_type: Search type of /ask, if any
+        count: Number of images for /draw
+        has_file: Whether a file is attached
+
+    Returns:
+        Cost in tokens
+    """
+    if command == 'draw':
+        return DRAW_IMAGE_COST * max(1, count)
+    cost = SEARCH_COSTS.get(request_type, CHAT_COST)
+    if has_file:
+        cost += FILE_COST
+    return cost
+
+class RateLimiter:
+    """In-memory token buckets per user, per guild and per command type."""
+
+    def __init__(self, admin_id: Optional[int] = None):
+        """
+        Args:
+            admin_id: User exempt from limits, ADMIN_ID env when omitted
+        """
+        self.enabled = os.getenv('RATE_LIMIT_ENABLED', 'True').lower() == 'true'
+        self.admin_id = admin_id if admin_id is not None else int(os.getenv('ADMIN_ID', 0) or 0)
+        self.limits = {
+            name: parse_limit(os.getenv(f'RATE_LIMIT_{name.upper()}', ''), default)
+            for name, default in DEFAULT_LIMITS.items()
+        }
+        self.buckets: Dict[Tuple[str, Any], TokenBucket] = {}
+        self.limited = 0
+
+    def _bucket(self, scope: str, key: Any) -> TokenBucket:
+        bucket = self.buckets.get((scope, key))
+        if bucket is None:
+            capacity, seconds = self.limits[scope]
+            bucket = self.buckets[(scope, key)] = TokenBucket(capacity, capacity / seconds)
+        return bucket
+
+    def _cleanup(self) -> None:
+        """Drop buckets that refilled completely, they behave like new ones."""
+        for key in [key for key, bucket in self.buckets.items() if bucket.full]:
+            del self.buckets[key]
+
+    def check(self, user_id: int, guild_id: Optional[int], commands: List[str], cost: int) -> float:
+        """
+        Take `cost` tokens from the user's, the guild's and each command's bucket, or from none of them.
+
+        Args:
+            user_id: Discord user ID
+            guild_id: Discord guild ID, None for DMs
+            commands: Command buckets the request counts against, e.g. ["ask", "search"]
+            cost: Tokens the request costs
+
+        Returns:
+            Seconds to wait before retrying, 0 if the request is allowed
+        """
+        if not self.enabled or user_id == self.admin_id:
+            return 0.0
+        if len(self.buckets) > MAX_BUCKETS:
+            self._cleanup()
+
+        buckets = [self._bucket('user', user_id)]
+        if guild_id is not None:
+            buckets.append(self._bucket('guild', guild_id))
+        buckets.extend(self._bucket(command, user_id) for command in commands)
+
+        # A request bigger than a bucket empties it instead of being refused forever
+        retry_after = max(bucket.retry_after(min(cost, bucket.capacity)) for bucket in buckets)
+        if retry_after > 0:
+            self.limited += 1
+            return retry_after
+        for bucket in buckets:
+            bucket.consume(min(cost, bucket.capacity))
+        return 0.0
+
+    async def check_and_respond(
+        self,
+        target: Any,
+        commands: List[str],
+        cost: int
+    ) -> bool:
+        """
+        Check the limits for an interaction or message and tell the user if they are exceeded.
+
+        Args:
+            target: Discord interaction or message
+            commands: Command buckets the request counts against
+            cost: Tokens the request costs
+
+        Returns:
+            True if the request is rate limited and was answered
+        """
+        user = target.user if isinstance(target, discord.Interaction) else target.author
+        guild_id = target.guild.id if target.guild is not None else None
+        retry_after = self.check(user.id, guild_id, commands, cost)
+        if not retry_after:
+            return False
+
+        logger.info(lm.get('log_rate_limited').format(username=str(user), commands=', '.join(commands), cost=cost, retry_after=retry_after))
+        message = lm.get('rate_limited').format(retry_after=int(retry_after) + 1)
+        try:
+            if isinstance(target, discord.Interaction):
+                if target.response.is_done():
+                    await target.followup.send(message, ephemeral=True)
+                else:
+                    await target.response.send_message(message, ephemeral=True)
+            else:
+                await target.channel.send(message, delete_after=min(retry_after + 1, 60))
+        except discord.HTTPException as e:
+            logger.error(lm.get('log_send_error').format(error=e))
+        return True
+
+# Global instance
+rate_limiter = RateLimiter()
@@ -0,0 +1,218 @@
+import os
+import heapq
+import asyncio
+import itertools
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+from src.log import logger
+from src.locale_manager import locale_manager as lm
+
+# Constants
+MAX_CONCURRENT = 8          # LLM requests processed at the same time
+MAX_QUEUE = 200             # requests waiting in total
+MAX_QUEUE_PER_USER = 3      # requests one user may have waiting
+MAX_RUNNING_PER_USER = 1    # requests of one user processed at the same time
+CHANNEL_WEIGHT = 3.0        # share of a channel relative to a single user
+SEARCH_COST = 2.0           # relative cost of a request with web search
+WAIT_WINDOW = 500           # recent queue waits kept for metrics
+
+# Lanes, lower is served first
+LANE_PRIORITY = 0
+LANE_NORMAL = 1
+
+class SchedulerFullError(Exception):
+    """Raised when a request cannot be queued."""
+    pass
+
+@dataclass(order=True)
+class ScheduledJob:
+    """A queued unit of LLM work, ordered by lane, virtual finish time and arrival."""
+    lane: int
+    finish: float
+    seq: int
+    user_id: int = field(compare=False)
+    channel_id: Optional[int] = field(compare=False)
+    run: Callable[[], Awaitable[Any]] = field(compare=False)
+    queued_at: float = field(compare=False, default_factory=time.monotonic)
+
+class RequestScheduler:
+    """
+    Runs LLM requests under a global concurrency cap, sharing capacity fairly.
+
+    Queued requests are ordered by weighted fair queuing: each request gets a
+    virtual finish time from both its user's and its channel's previous
+    requests, so a user spamming a busy channel only delays their own
+    requests, and one busy channel cannot take over the bot. A user's next
+    request waits until their running ones finish, so one user cannot hold
+    every slot. Admin requests use a priority lane.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        max_queue_per_user: Optional[int] = None,
+        max_running_per_user: Optional[int] = None,
+        channel_weight: Optional[float] = None,
+        admin_id: Optional[int] = None
+    ):
+        """
+        Args:
+            max_concurrent: Requests running at the same time, SCHEDULER_MAX_CONCURRENT env when omitted
+            max_queue: Requests waiting in total, SCHEDULER_MAX_QUEUE env when omitted
+            max_queue_per_user: Requests one user may have waiting, SCHEDULER_MAX_QUEUE_PER_USER env when omitted
+            max_running_per_user: Requests of one user running at the same time, SCHEDULER_MAX_RUNNING_PER_USER env when omitted
+            channel_weight: Share of a channel relative to a user, SCHEDULER_CHANNEL_WEIGHT env when omitted
+            admin_id: User served in the priority lane, ADMIN_ID env when omitted
+        """
+        self.max_concurrent = max_concurrent or int(os.getenv('SCHEDULER_MAX_CONCURRENT', MAX_CONCURRENT))
+        self.max_queue = max_queue or int(os.getenv('SCHEDULER_MAX_QUEUE', MAX_QUEUE))
+        self.max_queue_per_user = max_queue_per_user or int(os.getenv('SCHEDULER_MAX_QUEUE_PER_USER', MAX_QUEUE_PER_USER))
+        self.max_running_per_user = max_running_per_user or int(os.getenv('SCHEDULER_MAX_RUNNING_PER_USER', MAX_RUNNING_PER_USER))
+        self.channel_weight = channel_weight or float(os.getenv('SCHEDULER_CHANNEL_WEIGHT', CHANNEL_WEIGHT))
+        self.admin_id = admin_id if admin_id is not None else int(os.getenv('ADMIN_ID', 0) or 0)
+
+        self.heap: List[ScheduledJob] = []
+        self.seq = itertools.count()
+        self.virtual_time = 0.0
+        self.user_finish: Dict[int, float] = {}
+        self.channel_finish: Dict[int, float] = {}
+        self.queued_per_user: Dict[int, int] = {}
+        self.running_per_user: Dict[int, int] = {}
+        self.running = 0
+        self.tasks: set = set()
+
+        # Metrics
+        self.waits: Deque[float] = deque(maxlen=WAIT_WINDOW)
+        self.served = 0
+        self.rejected = 0
+        self.max_depth = 0
+
+    def _finish_time(self, user_id: int, channel_id: Optional[int], cost: float) -> float:
+        """Virtual finish time of a new request, updating its user's and channel's tags."""
+        user_finish = max(self.virtual_time, self.user_finish.get(user_id, 0.0)) + cost
+        self.user_finish[user_id] = user_finish
+        finish = user_finish
+        if channel_id is not None:
+            channel_finish = max(self.virtual_time, self.channel_finish.get(channel_id, 0.0)) + cost / self.channel_weight
+            self.channel_finish[channel_id] = channel_finish
+            finish = max(finish, channel_finish)
+        return finish
+
+    def position(self, job: ScheduledJob) -> int:
+        """1-based position of a queued job."""
+        return sum(1 for other in self.heap if other < job) + 1
+
+    def submit(
+        self,
+        user_id: int,
+        channel_id: Optional[int],
+        run: Callable[[], Awaitable[Any]],
+        cost: float = 1.0
+    ) -> int:
+        """
+        Queue a request.
+
+        Args:
+            user_id: Discord user ID
+            channel_id: Discord channel ID, None for DMs
+            run: Starts the request when called
+            cost: Relative cost, expensive requests move their user back further
+
+        Returns:
+            Queue position, 0 if the request started right away
+
+        Raises:
+            SchedulerFullError: If the user's or the global queue is full
+        """
+        priority = user_id == self.admin_id
+        if not priority:
+            if self.queued_per_user.get(user_id, 0) >= self.max_queue_per_user:
+                self.rejected += 1
+                raise SchedulerFullError(lm.get('scheduler_user_queue_full').format(limit=self.max_queue_per_user))
+            if len(self.heap) >= self.max_queue:
+                self.rejected += 1
+                raise SchedulerFullError(lm.get('scheduler_queue_full'))
+
+        job = ScheduledJob(
+            lane=LANE_PRIORITY if priority else LANE_NORMAL,
+            finish=self._finish_time(user_id, channel_id, cost),
+            seq=next(self.seq),
+            user_id=user_id,
+            channel_id=channel_id,
+            run=run
+        )
+        heapq.heappush(self.heap, job)
+        self.queued_per_user[user_id] = self.queued_per_user.get(user_id, 0) + 1
+        self.max_depth = max(self.max_depth, len(self.heap))
+        self._dispatch()
+        return self.position(job) if job in self.heap else 0
+
+    def _dispatch(self) -> None:
+        """Start queued jobs while there is capacity, skipping users at their running cap."""
+        deferred = []
+        while self.heap and self.running < self.max_concurrent:
+            job = heapq.heappop(self.heap)
+            if self.running_per_user.get(job.user_id, 0) >= self.max_running_per_user:
+                # The user's earlier request is still running, keep this one's place
+                deferred.append(job)
+                continue
+
+            self.virtual_time = max(self.virtual_time, job.finish)
+            remaining = self.queued_per_user.get(job.user_id, 1) - 1
+            if remaining:
+                self.queued_per_user[job.user_id] = remaining
+            else:
+                self.queued_per_user.pop(job.user_id, None)
+
+            self.waits.append(time.monotonic() - job.queued_at)
+            self.running += 1
+            self.running_per_user[job.user_id] = self.running_per_user.get(job.user_id, 0) + 1
+            task = asyncio.create_task(self._run(job))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+        for job in deferred:
+            heapq.heappush(self.heap, job)
+        if not self.heap:
+            # Idle again: forget tags so they do not grow forever
+            self.user_finish.clear()
+            self.channel_finish.clear()
+
+    async def _run(self, job: ScheduledJob) -> None:
+        try:
+            await job.run()
+        except Exception as e:
+            logger.exception(lm.get('log_scheduler_job_error').format(user_id=job.user_id, error=e))
+        finally:
+            self.running -= 1
+            running = self.running_per_user.get(job.user_id, 1) - 1
+            if running:
+                self.running_per_user[job.user_id] = running
+            else:
+                self.running_per_user.pop(job.user_id, None)
+            self.served += 1
+            self._dispatch()
+
+    def metrics(self) -> Dict[str, Any]:
+        """Queue depth, concurrency and wait time statistics."""
+        waits = sorted(self.waits)
+        def percentile(q: float) -> float:
+            return waits[min(len(waits) - 1, int(q * len(waits)))] if waits else 0.0
+        return {
+            'depth': len(self.heap),
+            'max_depth': self.max_depth,
+            'running': self.running,
+            'limit': self.max_concurrent,
+            'served': self.served,
+            'rejected': self.rejected,
+            'wait_p50': percentile(0.5),
+            'wait_p95': percentile(0.95),
+            'wait_max': waits[-1] if waits else 0.0
+        }
+
+    def log_metrics(self) -> None:
+        logger.info(lm.get('log_scheduler_metrics').format(**self.metrics()))
+        self.max_depth = len(self.heap)
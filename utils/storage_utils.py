@@ -0,0 +1,744 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import weakref
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from src.log import logger
+from src.locale_manager import locale_manager as lm
+from utils.files_utils import read_bytes, write_file, json_dumps, json_loads, run_blocking
+from utils.encryption_utils import UserDataEncryptor
+from utils.compression_utils import Compressor, detect_codec
+
+# Constants
+DEFAULT_DB_FILE = os.path.join('user_data', 'conversations.db')
+BUSY_TIMEOUT = 5000         # ms a connection waits for a lock held by another process
+MAX_TRACKED = 10000         # conversations whose stored message hashes are remembered
+COMPACT_RATIO = 3.0         # a log is compacted when it is this many times larger than its live records
+COMPACT_MIN_BYTES = 65536   # logs smaller than this are never compacted
+
+# Fields kept in their own columns, everything else is stored as settings
+COLUMN_FIELDS = ('history', 'model', 'vision_support')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT PRIMARY KEY,
+    user_id INTEGER,
+    channel_id INTEGER,
+    model TEXT,
+    vision_support INTEGER,
+    encrypted INTEGER NOT NULL DEFAULT 0,
+    settings TEXT,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    name TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (name, seq)
+) WITHOUT ROWID;
+"""
+
+class ConversationStorage(ABC):
+    """
+    Interface of conversation storage backends.
+
+    Conversations are addressed by the path returned by
+    DiscordClient.get_user_data_filepath, which also names them in logs.
+    """
+
+    name = 'base'
+
+    @abstractmethod
+    async def load(self, filepath: str, user_id: Optional[int], channel_id: Optional[int]) -> Optional[Dict[str, Any]]:
+        """
+        Load a conversation.
+
+        Args:
+            filepath: Conversation path
+            user_id: Discord user ID
+            channel_id: Discord channel ID, None for DMs
+
+        Returns:
+            User data dictionary, None if the conversation does not exist
+
+        Raises:
+            ValueError: If stored data cannot be decrypted or parsed
+        """
+
+    @abstractmethod
+    async def save(self, filepath: str, user_id: Optional[int], channel_id: Optional[int], data: Dict[str, Any]) -> bool:
+        """
+        Save a conversation.
+
+        Args:
+            filepath: Conversation path
+            user_id: Discord user ID
+            channel_id: Discord channel ID, None for DMs
+            data: User data dictionary
+
+        Returns:
+            True if the data was saved
+        """
+
+    async def maintain(self) -> None:
+        """Periodic housekeeping, called by the client's background task."""
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Backend metrics for the periodic storage log line, empty if there are none."""
+        return {}
+
+    async def close(self) -> None:
+        """Release the backend's resources."""
+        pass
+
+class JsonFileStorage(ConversationStorage):
+    """
+    One JSON file per conversation, encrypted as a whole when required.
+
+    Payloads are compressed before they are encrypted. Plain, compressed
+    and encrypted files are told apart on read, so existing files stay
+    readable whatever the current settings.
+    """
+
+    name = 'json'
+
+    def __init__(self, should_encrypt: Callable[[Optional[int]], bool], compressor: Optional[Compressor] = None):
+        """
+        Args:
+            should_encrypt: Tells by channel ID whether a conversation is stored encrypted
+            compressor: Compressor of written files, configured from STORAGE_COMPRESSION env when omitted
+        """
+        self.should_encrypt = should_encrypt
+        self.compressor = compressor or Compressor()
+
+    async def _decode(self, payload: bytes) -> Any:
+        if detect_codec(payload) != 'none':
+            payload = await run_blocking(self.compressor.decompress, payload)
+        return json_loads(payload)
+
+    async def load(self, filepath: str, user_id: Optional[int], channel_id: Optional[int]) -> Optional[Dict[str, Any]]:
+        raw = await read_bytes(filepath)
+        if not raw:
+            return None
+
+        try:
+            return await self._decode(raw)
+        except json.JSONDecodeError:
+            encryptor = await UserDataEncryptor(user_id, channel_id).initialize()
+            payload = await encryptor.decrypt_bytes(raw)
+            if payload is None:
+                raise ValueError(lm.get('error_decryption_failed'))
+            return await self._decode(payload)
+
+    async def save(self, filepath: str, user_id: Optional[int], channel_id: Optional[int], data: Dict[str, Any]) -> bool:
+        try:
+            payload = json_dumps(data)
+        except Exception as e:
+            logger.error(lm.get('file_json_write_error').format(filepath=filepath, error=e))
+            return False
+        if self.compressor.codec != 'none':
+            payload = await run_blocking(self.compressor.compress, payload)
+
+        if self.should_encrypt(channel_id):
+            encryptor = await UserDataEncryptor(user_id, channel_id).initialize()
+            payload = await encryptor.encrypt_bytes(payload)
+            if not payload:
+                logger.error(lm.get('encryption_encrypt_error').format(error="Failed to encrypt data"))
+                return False
+        return await write_file(filepath, payload, mode='wb')
+
+    def stats(self) -> Dict[str, Any]:
+        if self.compressor.codec == 'none' and not self.compressor.decompressed:
+            return {}
+        return self.compressor.stats()
+
+def _message_hash(message: Any) -> str:
+    return hashlib.sha1(json_dumps(message, sort_keys=True)).hexdigest()
+
+@dataclass
+class StoredState:
+    """What a backend holds for a conversation, as last loaded or written."""
+    encrypted: bool
+    entries: List[Tuple[int, str]]  # (seq, hash) of live messages in order
+    header_hash: str
+    next_seq: int
+
+def _diff_messages(entries: List[Tuple[int, str]], hashes: List[str]) -> Tuple[List[Tuple[int, str]], List[int], int]:
+    """
+    Match a new history against the stored messages.
+
+    Stored messages that are still in the history in the same order are
+    kept, the others are deleted, and the history's remaining tail is new.
+
+    Args:
+        entries: (seq, hash) of the stored messages in order
+        hashes: Hashes of the new history's messages
+
+    Returns:
+        Tuple of (kept entries, deleted seqs, number of leading history messages that were kept)
+    """
+    kept, deleted = [], []
+    position = 0
+    for new_hash in hashes:
+        found = next((i for i in range(position, len(entries)) if entries[i][1] == new_hash), None)
+        if found is None:
+            break
+        deleted.extend(seq for seq, _ in entries[position:found])
+        kept.append(entries[found])
+        position = found + 1
+    deleted.extend(seq for seq, _ in entries[position:])
+    return kept, deleted, len(kept)
+
+class IncrementalStorage(ConversationStorage):
+    """
+    Base of backends that store messages separately and write only what changed.
+
+    Remembers what was last stored for recently used conversations and
+    imports conversations it does not have from a legacy backend.
+    """
+
+    def __init__(self, should_encrypt: Callable[[Optional[int]], bool], legacy: Optional[ConversationStorage] = None):
+        """
+        Args:
+            should_encrypt: Tells by channel ID whether a conversation is stored encrypted
+            legacy: Backend conversations are imported from, None to disable importing
+        """
+        self.should_encrypt = should_encrypt
+        self.legacy = legacy
+        self._stored: OrderedDict[str, Any] = OrderedDict()
+
+    @staticmethod
+    def _name(filepath: str) -> str:
+        return os.path.splitext(os.path.basename(filepath))[0]
+
+    def _remember(self, name: str, state: Any) -> None:
+        self._stored[name] = state
+        self._stored.move_to_end(name)
+        while len(self._stored) > MAX_TRACKED:
+            self._stored.popitem(last=False)
+
+    async def _import_legacy(self, filepath: str, user_id: Optional[int], channel_id: Optional[int]) -> Optional[Dict[str, Any]]:
+        if self.legacy is None:
+            return None
+        data = await self.legacy.load(filepath, user_id, channel_id)
+        if data and await self.save(filepath, user_id, channel_id, data):
+            logger.info(lm.get('log_storage_imported').format(filepath=filepath, backend=self.name))
+        return data
+
+class SqliteStorage(IncrementalStorage):
+    """
+    Conversations in one SQLite database in WAL mode, one row per message.
+
+    Every message row has a stable, increasing sequence number. A save
+    deletes the rows of messages that left the history since it was last
+    loaded or saved and inserts the new ones, so appending a turn writes
+    two rows even after older turns are windowed out. Message and settings values of
+    encrypted conversations are encrypted row by row; model and vision flag
+    stay readable. Conversations missing from the database are imported
+    from their legacy JSON file on first load.
+    """
+
+    name = 'sqlite'
+
+    def __init__(
+        self,
+        should_encrypt: Callable[[Optional[int]], bool],
+        db_path: Optional[str] = None,
+        legacy: Optional[ConversationStorage] = None
+    ):
+        """
+        Args:
+            should_encrypt: Tells by channel ID whether a conversation is stored encrypted
+            db_path: Database file, STORAGE_DB_PATH env when omitted
+            legacy: Backend conversations are imported from, None to disable importing
+        """
+        super().__init__(should_encrypt, legacy)
+        self.db_path = db_path or os.getenv('STORAGE_DB_PATH', DEFAULT_DB_FILE)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        # self._stored: name -> StoredState
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            dirpath = os.path.dirname(self.db_path)
+            if dirpath:
+                os.makedirs(dirpath, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT}')
+            conn.executescript(SCHEMA)
+            self._conn = conn
+            logger.info(lm.get('log_storage_opened').format(backend=self.name, path=self.db_path))
+        return self._conn
+
+    def _read(self, name: str) -> Optional[Tuple[tuple, List[tuple]]]:
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                'SELECT model, vision_support, encrypted, settings FROM conversations WHERE name = ?',
+                (name,)
+            ).fetchone()
+            if row is None:
+                return None
+            messages = conn.execute(
+                'SELECT seq, data FROM messages WHERE name = ? ORDER BY seq',
+                (name,)
+            ).fetchall()
+            return row, messages
+
+    def _write(
+        self,
+        name: str,
+        meta: tuple,
+        deleted: Optional[List[int]],
+        rows: List[Tuple[int, Optional[str], str]]
+    ) -> None:
+        """Upsert a conversation, delete the given message seqs (all if None) and insert rows."""
+        with self._lock:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute(
+                    'INSERT INTO conversations (name, user_id, channel_id, model, vision_support, encrypted, settings, updated_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT(name) DO UPDATE SET user_id = excluded.user_id, channel_id = excluded.channel_id, '
+                    'model = excluded.model, vision_support = excluded.vision_support, encrypted = excluded.encrypted, '
+                    'settings = excluded.settings, updated_at = excluded.updated_at',
+                    (name, *meta)
+                )
+                if deleted is None:
+                    conn.execute('DELETE FROM messages WHERE name = ?', (name,))
+                else:
+                    conn.executemany('DELETE FROM messages WHERE name = ? AND seq = ?', [(name, seq) for seq in deleted])
+                conn.executemany(
+                    'INSERT INTO messages (name, seq, role, data) VALUES (?, ?, ?, ?)',
+                    [(name, seq, role, value) for seq, role, value in rows]
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    async def load(self, filepath: str, user_id: Optional[int], channel_id: Optional[int]) -> Optional[Dict[str, Any]]:
+        name = self._name(filepath)
+        stored = await run_blocking(self._read, name)
+        if stored is None:
+            return await self._import_legacy(filepath, user_id, channel_id)
+
+        (model, vision_support, encrypted, settings), rows = stored
+        encryptor = await UserDataEncryptor(user_id, channel_id).initialize() if encrypted else None
+
+        async def decode(value: Optional[str]) -> Any:
+            if value is None:
+                return None
+            decoded = await encryptor.decrypt(value) if encryptor else json_loads(value)
+            if decoded is None:
+                raise ValueError(lm.get('error_decryption_failed'))
+            return decoded
+
+        history = [await decode(data) for _, data in rows]
+        data = {'history': history, 'model': model}
+        if vision_support is not None:
+            data['vision_support'] = bool(vision_support)
+        data.update(await decode(settings) or {})
+
+        self._remember(name, StoredState(
+            encrypted=bool(encrypted),
+            entries=[(seq, _message_hash(message)) for (seq, _), message in zip(rows, history)],
+            header_hash='',
+            next_seq=rows[-1][0] + 1 if rows else 0
+        ))
+        return data
+
+    async def save(self, filepath: str, user_id: Optional[int], channel_id: Optional[int], data: Dict[str, Any]) -> bool:
+        name = self._name(filepath)
+        encrypted = bool(self.should_encrypt(channel_id))
+        encryptor = await UserDataEncryptor(user_id, channel_id).initialize() if encrypted else None
+
+        async def encode(value: Any) -> Optional[str]:
+            if encryptor is None:
+                return json_dumps(value).decode('utf-8')
+            return await encryptor.encrypt(value)
+
+        history = data.get('history', [])
+        hashes = [_message_hash(message) for message in history]
+
+        # An unknown or re-encrypted conversation is rewritten
+        state = self._stored.get(name)
+        if state is None or state.encrypted != encrypted:
+            entries, deleted, matched, next_seq = [], None, 0, 0
+        else:
+            entries, deleted, matched = _diff_messages(state.entries, hashes)
+            next_seq = state.next_seq
+
+        rows = []
+        for message, message_hash in zip(history[matched:], hashes[matched:]):
+            value = await encode(message)
+            if value is None:
+                logger.error(lm.get('encryption_encrypt_error').format(error="Failed to encrypt data"))
+                return False
+            rows.append((next_seq, message.get('role'), value))
+            entries.append((next_seq, message_hash))
+            next_seq += 1
+
+        settings = await encode({key: value for key, value in data.items() if key not in COLUMN_FIELDS})
+        if settings is None:
+            logger.error(lm.get('encryption_encrypt_error').format(error="Failed to encrypt data"))
+            return False
+        vision_support = data.get('vision_support')
+        meta = (
+            user_id,
+            channel_id,
+            data.get('model'),
+            None if vision_support is None else int(bool(vision_support)),
+            int(encrypted),
+            settings,
+            time.time()
+        )
+
+        try:
+            await run_blocking(self._write, name, meta, deleted, rows)
+        except sqlite3.Error as e:
+            self._stored.pop(name, None)
+            logger.error(lm.get('file_write_error').format(filepath=f'{self.db_path}:{name}', error=e))
+            return False
+        self._remember(name, StoredState(encrypted, entries, '', next_seq))
+        return True
+
+    async def close(self) -> None:
+        def close_connection():
+            with self._lock:
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+        await run_blocking(close_connection)
+
+class _FileLock:
+    """Lock of one log, held weakly by the storage so idle logs do not keep one."""
+    def __init__(self):
+        self.lock = threading.Lock()
+
+class JsonlLogStorage(IncrementalStorage):
+    """
+    One append-only JSONL log per conversation.
+
+    Each line is a record: "h" holds the header (model, instruction, flags
+    and other settings), "m" one message with its sequence number and "d"
+    the sequence numbers of messages that left the history. A sidecar
+    index keeps the byte offsets of the latest header and the live
+    messages, so loading seeks to them instead of replaying the log.
+    maintain() rewrites logs that grew mostly dead. Record values of
+    encrypted conversations are encrypted line by line.
+    """
+
+    name = 'jsonl'
+
+    def __init__(
+        self,
+        should_encrypt: Callable[[Optional[int]], bool],
+        legacy: Optional[ConversationStorage] = None,
+        compact_ratio: Optional[float] = None
+    ):
+        """
+        Args:
+            should_encrypt: Tells by channel ID whether a conversation is stored encrypted
+            legacy: Backend conversations are imported from, None to disable importing
+            compact_ratio: Log to live size ratio that triggers compaction, STORAGE_COMPACT_RATIO env when omitted
+        """
+        super().__init__(should_encrypt, legacy)
+        self.compact_ratio = compact_ratio or float(os.getenv('STORAGE_COMPACT_RATIO', COMPACT_RATIO))
+        self._locks: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+        self._compaction_queue: Set[str] = set()
+        # self._stored: name -> StoredState
+
+    @staticmethod
+    def _log_path(filepath: str) -> str:
+        return os.path.splitext(filepath)[0] + '.jsonl'
+
+    def _lock_for(self, log_path: str) -> _FileLock:
+        lock = self._locks.get(log_path)
+        if lock is None:
+            lock = self._locks[log_path] = _FileLock()
+        return lock
+
+    # Blocking helpers, called in a worker thread while holding the log's lock
+
+    @staticmethod
+    def _write_index(log_path: str, index: Dict[str, Any]) -> None:
+        tmp_path = log_path + '.idx.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(json_dumps(index))
+        os.replace(tmp_path, log_path + '.idx')
+
+    @classmethod
+    def _scan(cls, log_path: str) -> Dict[str, Any]:
+        """Rebuild a log's index by replaying it, cutting off a partly written last line."""
+        header = None
+        live: Dict[int, List[int]] = {}
+        next_seq = 0
+        offset = 0
+        with open(log_path, 'rb+') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    f.truncate(offset)
+                    break
+                try:
+                    record = json_loads(line)
+                except json.JSONDecodeError:
+                    offset += len(line)
+                    continue
+                if record['t'] == 'h':
+                    header = [offset, len(line)]
+                elif record['t'] == 'm':
+                    live[record['s']] = [offset, len(line)]
+                    next_seq = max(next_seq, record['s'] + 1)
+                elif record['t'] == 'd':
+                    for seq in record['s']:
+                        live.pop(seq, None)
+                offset += len(line)
+        index = {
+            'size': offset,
+            'header': header,
+            'next_seq': next_seq,
+            'live': [[seq, *live[seq]] for seq in sorted(live)]
+        }
+        cls._write_index(log_path, index)
+        return index
+
+    @classmethod
+    def _read_index(cls, log_path: str) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(log_path):
+            return None
+        size = os.path.getsize(log_path)
+        try:
+            with open(log_path + '.idx', 'rb') as f:
+                index = json_loads(f.read())
+            if index.get('size') == size:
+                return index
+        except (OSError, ValueError):
+            pass
+        return cls._scan(log_path)
+
+    def _read_log(self, log_path: str, lock: _FileLock) -> Optional[Tuple[int, Optional[dict], List[dict]]]:
+        with lock.lock:
+            index = self._read_index(log_path)
+            if index is None:
+                return None
+            with open(log_path, 'rb') as f:
+                def read(offset: int, length: int) -> dict:
+                    f.seek(offset)
+                    return json_loads(f.read(length))
+                header = read(*index['header']) if index['header'] else None
+                messages = [read(offset, length) for _, offset, length in index['live']]
+            return index['next_seq'], header, messages
+
+    def _needs_compaction(self, index: Dict[str, Any]) -> bool:
+        live_bytes = sum(length for _, _, length in index['live']) + (index['header'][1] if index['header'] else 0)
+        return index['size'] > COMPACT_MIN_BYTES and index['size'] > self.compact_ratio * live_bytes
+
+    def _append(self, log_path: str, lock: _FileLock, lines: List[Tuple[str, Any, bytes]]) -> bool:
+        with lock.lock:
+            index = self._read_index(log_path) or {'size': 0, 'header': None, 'next_seq': 0, 'live': []}
+            live = {seq: [offset, length] for seq, offset, length in index['live']}
+            offset = index['size']
+            os.makedirs(os.path.dirname(log_path) or '.', exist_ok=True)
+            with open(log_path, 'ab') as f:
+                for kind, seq, line in lines:
+                    f.write(line)
+                    if kind == 'h':
+                        index['header'] = [offset, len(line)]
+                    elif kind == 'm':
+                        live[seq] = [offset, len(line)]
+                        index['next_seq'] = max(index['next_seq'], seq + 1)
+                    elif kind == 'd':
+                        for deleted in seq:
+                            live.pop(deleted, None)
+                    offset += len(line)
+            index['size'] = offset
+            index['live'] = [[seq, *live[seq]] for seq in sorted(live)]
+            self._write_index(log_path, index)
+            return self._needs_compaction(index)
+
+    @classmethod
+    def _write_log(cls, log_path: str, lines: List[Tuple[str, Any, bytes]]) -> None:
+        """Replace a log with the given lines, which must hold a header and messages only."""
+        os.makedirs(os.path.dirname(log_path) or '.', exist_ok=True)
+        index = {'size': 0, 'header': None, 'next_seq': 0, 'live': []}
+        tmp_path = log_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            for kind, seq, line in lines:
+                f.write(line)
+                if kind == 'h':
+                    index['header'] = [index['size'], len(line)]
+                else:
+                    index['live'].append([seq, index['size'], len(line)])
+                    index['next_seq'] = max(index['next_seq'], seq + 1)
+                index['size'] += len(line)
+        os.replace(tmp_path, log_path)
+        cls._write_index(log_path, index)
+
+    def _rewrite(self, log_path: str, lock: _FileLock, lines: List[Tuple[str, Any, bytes]]) -> None:
+        with lock.lock:
+            self._write_log(log_path, lines)
+
+    def _compact(self, log_path: str, lock: _FileLock) -> Optional[Tuple[int, int]]:
+        with lock.lock:
+            index = self._read_index(log_path)
+            if index is None or not self._needs_compaction(index):
+                return None
+            before = index['size']
+            with open(log_path, 'rb') as f:
+                def read(offset: int, length: int) -> bytes:
+                    f.seek(offset)
+                    return f.read(length)
+                lines = [('h', None, read(*index['header']))] if index['header'] else []
+                lines.extend(('m', seq, read(offset, length)) for seq, offset, length in index['live'])
+            # The rewrite keeps sequence numbers, so remembered log states stay valid
+            self._write_log(log_path, lines)
+            return before, sum(len(line) for _, _, line in lines)
+
+    # Async interface
+
+    async def load(self, filepath: str, user_id: Optional[int], channel_id: Optional[int]) -> Optional[Dict[str, Any]]:
+        log_path = self._log_path(filepath)
+        stored = await run_blocking(self._read_log, log_path, self._lock_for(log_path))
+        if stored is None:
+            return await self._import_legacy(filepath, user_id, channel_id)
+
+        next_seq, header_record, message_records = stored
+        encryptor = None
+
+        async def decode(record: Optional[dict]) -> Any:
+            nonlocal encryptor
+            if record is None:
+                return {}
+            if 'e' not in record:
+                return record['v']
+            if encryptor is None:
+                encryptor = await UserDataEncryptor(user_id, channel_id).initialize()
+            value = await encryptor.decrypt(record['e'])
+            if value is None:
+                raise ValueError(lm.get('error_decryption_failed'))
+            return value
+
+        header = await decode(header_record)
+        history = [await decode(record) for record in message_records]
+
+        self._remember(self._name(filepath), StoredState(
+            encrypted=header_record is not None and 'e' in header_record,
+            entries=[(record['s'], _message_hash(message)) for record, message in zip(message_records, history)],
+            header_hash=_message_hash(header),
+            next_seq=next_seq
+        ))
+        return {'history': history, **header}
+
+    async def save(self, filepath: str, user_id: Optional[int], channel_id: Optional[int], data: Dict[str, Any]) -> bool:
+        name = self._name(filepath)
+        log_path = self._log_path(filepath)
+        encrypted = bool(self.should_encrypt(channel_id))
+        encryptor = await UserDataEncryptor(user_id, channel_id).initialize() if encrypted else None
+
+        async def encode(kind: str, seq: Any, value: Any = None) -> Optional[bytes]:
+            record = {'t': kind}
+            if seq is not None:
+                record['s'] = seq
+            if kind != 'd':
+                if encryptor is None:
+                    record['v'] = value
+                else:
+                    record['e'] = await encryptor.encrypt(value)
+                    if not record['e']:
+                        return None
+            return json_dumps(record) + b'\n'
+
+        history = data.get('history', [])
+        header = {key: value for key, value in data.items() if key != 'history'}
+        hashes = [_message_hash(message) for message in history]
+        header_hash = _message_hash(header)
+
+        state = self._stored.get(name)
+        rewrite = state is None or state.encrypted != encrypted
+        records: List[Tuple[str, Any, Any]] = []
+        if rewrite:
+            # Unknown or re-encrypted conversation: start a fresh log
+            records.append(('h', None, header))
+            records.extend(('m', seq, message) for seq, message in enumerate(history))
+            entries = list(enumerate(hashes))
+            next_seq = len(history)
+        else:
+            entries, deleted, matched = _diff_messages(state.entries, hashes)
+
+            if header_hash != state.header_hash:
+                records.append(('h', None, header))
+            if deleted:
+                records.append(('d', deleted, None))
+            next_seq = state.next_seq
+            for message, message_hash in zip(history[matched:], hashes[matched:]):
+                records.append(('m', next_seq, message))
+                entries.append((next_seq, message_hash))
+                next_seq += 1
+            if not records:
+                return True
+
+        lines = []
+        for kind, seq, value in records:
+            line = await encode(kind, seq, value)
+            if line is None:
+                logger.error(lm.get('encryption_encrypt_error').format(error="Failed to encrypt data"))
+                return False
+            lines.append((kind, seq, line))
+
+        lock = self._lock_for(log_path)
+        try:
+            if rewrite:
+                await run_blocking(self._rewrite, log_path, lock, lines)
+            elif await run_blocking(self._append, log_path, lock, lines):
+                self._compaction_queue.add(log_path)
+        except OSError as e:
+            self._stored.pop(name, None)
+            logger.error(lm.get('file_write_error').format(filepath=log_path, error=e))
+            return False
+        self._remember(name, StoredState(encrypted, entries, header_hash, next_seq))
+        return True
+
+    async def maintain(self) -> None:
+        """Compact the logs that outgrew their live records."""
+        while self._compaction_queue:
+            log_path = self._compaction_queue.pop()
+            try:
+                result = await run_blocking(self._compact, log_path, self._lock_for(log_path))
+            except OSError as e:
+                logger.error(lm.get('file_write_error').format(filepath=log_path, error=e))
+                continue
+            if result:
+                logger.info(lm.get('log_storage_compacted').format(filepath=log_path, before=result[0], after=result[1]))
+
+def create_storage(backend: str, should_encrypt: Callable[[Optional[int]], bool]) -> ConversationStorage:
+    """
+    Create the configured storage backend.
+
+    Args:
+        backend: Backend name, "json", "sqlite" or "jsonl"
+        should_encrypt: Tells by channel ID whether a conversation is stored encrypted
+
+    Returns:
+        Storage backend, the JSON one for unknown names
+    """
+    json_storage = JsonFileStorage(should_encrypt)
+    backend = (backend or JsonFileStorage.name).lower()
+    if backend == SqliteStorage.name:
+        return SqliteStorage(should_encrypt, legacy=json_storage)
+    if backend == JsonlLogStorage.name:
+        return JsonlLogStorage(should_encrypt, legacy=json_storage)
+    if backend != JsonFileStorage.name:
+        logger.warning(lm.get('log_storage_unknown_backend').format(backend=backend))
+    return json_storage